@@ -1,13 +1,93 @@
 # api.py
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
+import asyncio
+from contextlib import asynccontextmanager, suppress
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+import hashlib
+import io
+import json
 import os
+import threading
+import time
+import numpy as np
+import pyarrow as pa
+import engine
+import jobs
+import profiling
+import watcher
 
-app = FastAPI()
+# Poll zip/ every N seconds and ingest new archives in the background (0: off)
+WATCH_INTERVAL = float(os.environ.get("EQUITY_WATCH_INTERVAL", "0"))
+zip_watcher = None
+
+# Screener dataset held in memory: loaded once at startup and swapped for a fresh one whenever
+# ingestion writes new data (or the F&O / tickers files change)
+screener_dataset = None
+screener_dataset_lock = threading.Lock()
+
+# Function to load the screener dataset: the F&O-filtered price frame plus what every request reuses
+@profiling.profiled("load_screener_dataset")
+def load_screener_dataset(version):
+    fno_list = engine.read_fno_list() or []
+    df = engine.load_screener_frame(fno_list)
+    if df is None:
+        return {"version": version, "df": None}
+    return {
+        "version": version,
+        "df": df,
+        "yesterday_open_price": engine.latest_open_prices(df),
+        "ticker_symbols": engine.read_ticker_symbols() or [],
+        "loaded_at": time.time(),
+    }
+
+# Function to get the current screener dataset, reloading it when the underlying files changed.
+# Readers keep using the old snapshot until the new one is swapped in.
+def get_screener_dataset():
+    global screener_dataset
+    version = engine.screener_version()
+    dataset = screener_dataset
+    if dataset is not None and dataset["version"] == version:
+        return dataset
+    with screener_dataset_lock:
+        if screener_dataset is None or screener_dataset["version"] != version:
+            screener_dataset = load_screener_dataset(version)
+        return screener_dataset
+
+# Background ingestion jobs started with POST /api/ingest (one run at a time, shared by callers)
+ingest_jobs = jobs.IngestJobManager(on_ingest=get_screener_dataset)
+
+@asynccontextmanager
+async def lifespan(app):
+    global zip_watcher
+    get_screener_dataset()
+    watcher_task = None
+    if WATCH_INTERVAL > 0:
+        zip_watcher = watcher.ZipWatcher(interval=WATCH_INTERVAL, ingest_jobs=ingest_jobs)
+        watcher_task = asyncio.create_task(zip_watcher.run())
+    yield
+    if watcher_task is not None:
+        watcher_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await watcher_task
+
+app = FastAPI(lifespan=lifespan)
 
 # Path to the merged_output.csv file
 MERGED_FILE_PATH = "output/merged_output.csv"
 
+# Columns available from /api/prices and the default projection
+PRICE_QUERY_COLUMNS = ['DATE', 'SYMBOL', 'SECURITY'] + engine.PRICE_COLUMNS
+DEFAULT_QUERY_COLUMNS = ['DATE', 'SYMBOL', 'SECURITY', 'OPEN_PRICE', 'HIGH_PRICE', 'LOW_PRICE', 'CLOSE_PRICE']
+JSON_PAGE_SIZE = 1000
+MAX_JSON_PAGE_SIZE = 10000
+CSV_CHUNK_ROWS = 50000
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
 @app.get("/")
 async def root():
     return {"message": "FastAPI server is running. Access the merged CSV at /api/merged-output"}
@@ -17,10 +97,200 @@ async def get_merged_output():
     # Check if the file exists
     if not os.path.exists(MERGED_FILE_PATH):
         raise HTTPException(status_code=404, detail="Merged output file not found")
-    
+
     # Return the file as a downloadable response
     return FileResponse(
         path=MERGED_FILE_PATH,
         media_type="text/csv",
         filename="merged_output.csv"
-    )
\ No newline at end of file
+    )
+
+# Function to build an ETag from the data version (ingested data, F&O and tickers files) and the
+# normalized query, so polling clients get a 304 until new data is ingested or fno_only changes
+def query_etag(params):
+    token = json.dumps([engine.screener_version(), params], sort_keys=True, default=str)
+    return '"' + hashlib.sha1(token.encode("utf-8")).hexdigest() + '"'
+
+# Function to check an If-None-Match header against the current ETag
+def not_modified(request, etag):
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+
+# Function to split comma-separated and repeated query values into one list
+def split_values(values):
+    return [value.strip() for item in values or [] for value in item.split(",") if value.strip()]
+
+# Function to stream a frame as CSV in chunks
+def iter_csv(df):
+    for start in range(0, max(len(df), 1), CSV_CHUNK_ROWS):
+        yield df.iloc[start:start + CSV_CHUNK_ROWS].to_csv(index=False, header=start == 0)
+
+# Function to serialize a frame as an Arrow IPC stream
+def to_arrow_bytes(df):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+# Function to find the SECURITY_IDs of the security master that pass the symbol, tickers and
+# security-type filters of a price query (None when nothing filters by security, or there is no
+# master), so the Parquet read only returns their rows
+def matching_security_ids(symbols, ticker_symbols, security_type):
+    master = engine.load_security_master()
+    if master is None or not (symbols or ticker_symbols is not None or security_type != "NONE"):
+        return None
+    allowed = np.ones(len(master), dtype=bool)
+    if symbols:
+        allowed &= master['SYMBOL'].isin(symbols).to_numpy()
+    if ticker_symbols is not None:
+        allowed &= master['SYMBOL'].isin(ticker_symbols).to_numpy()
+    type_mask = engine.security_type_mask(master, security_type)
+    if type_mask is not None:
+        allowed &= type_mask
+    return master['SECURITY_ID'].to_numpy()[allowed]
+
+@app.get("/api/prices")
+def get_prices(
+    request: Request,
+    symbol: list[str] = Query(None, description="Symbol(s), repeated or comma-separated"),
+    start: str = Query(None, description="First trade date (YYYY-MM-DD)"),
+    end: str = Query(None, description="Last trade date (YYYY-MM-DD)"),
+    security_type: str = Query("NONE", pattern="^(Nifty|2\\.5%|Others|NONE)$"),
+    fno_only: bool = Query(False, description="Only symbols listed in tickers.csv"),
+    min_close: float = Query(None, description="Minimum CLOSE_PRICE"),
+    columns: list[str] = Query(None, description="Columns to return, repeated or comma-separated"),
+    format: str = Query("json", pattern="^(json|csv|arrow)$"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(None, ge=1, description=f"Rows per page (json defaults to {JSON_PAGE_SIZE})"),
+):
+    symbols = [value.upper() for value in split_values(symbol)]
+    selected = split_values(columns) or DEFAULT_QUERY_COLUMNS
+    unknown = [col for col in selected if col not in PRICE_QUERY_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown column(s): {unknown}")
+    if format == "json":
+        limit = min(limit or JSON_PAGE_SIZE, MAX_JSON_PAGE_SIZE)
+
+    params = {
+        "symbols": sorted(symbols), "start": start, "end": end, "security_type": security_type,
+        "fno_only": fno_only, "min_close": min_close, "columns": selected, "format": format,
+        "offset": offset, "limit": limit,
+    }
+    etag = query_etag(params)
+    if not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    # Load only the needed columns, date partitions and securities, then filter (the merged CSV
+    # fallback is filtered here row by row)
+    needed = list(dict.fromkeys(selected + ['DATE', 'SYMBOL', 'SECURITY', 'CLOSE_PRICE']))
+    ticker_symbols = (engine.read_ticker_symbols() or []) if fno_only else None
+    try:
+        df = engine.load_price_data(
+            columns=needed, start=start, end=end, ids=matching_security_ids(symbols, ticker_symbols, security_type)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if df is None:
+        raise HTTPException(status_code=404, detail="Price data not found")
+
+    df['SYMBOL'] = df['SYMBOL'].astype(str).str.upper().str.strip()
+    if symbols:
+        df = df[df['SYMBOL'].isin(symbols)]
+    df = engine.filter_security_type(df, security_type)
+    if fno_only:
+        df = df[df['SYMBOL'].isin(ticker_symbols)]
+    if min_close is not None:
+        df = df[df['CLOSE_PRICE'] >= min_close]
+
+    df = df.sort_values(['DATE', 'SYMBOL', 'SECURITY'], kind="stable")[selected]
+    total = len(df)
+    df = df.iloc[offset:offset + limit] if limit else df.iloc[offset:]
+    headers = {"ETag": etag, "X-Total-Count": str(total)}
+
+    if format == "csv":
+        return StreamingResponse(iter_csv(df), media_type=MEDIA_TYPES["csv"], headers=headers)
+    if format == "arrow":
+        return Response(to_arrow_bytes(df), media_type=MEDIA_TYPES["arrow"], headers=headers)
+
+    if 'DATE' in df.columns:
+        df = df.assign(DATE=df['DATE'].dt.strftime("%Y-%m-%d"))
+    next_offset = offset + len(df) if offset + len(df) < total else None
+    body = {
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "next_offset": next_offset,
+        "rows": json.loads(df.to_json(orient="records")),
+    }
+    return Response(json.dumps(body), media_type=MEDIA_TYPES["json"], headers=headers)
+
+@app.get("/api/screener")
+def get_screener(
+    days: int = Query(5, ge=1, le=engine.INDICATOR_DAYS, description="Day range for the gain"),
+    gain_threshold: float = Query(1, description="Minimum GAIN_PERCENT"),
+    min_close: float = Query(10, description="Minimum CLOSE_PRICE (the sidebar close filter)"),
+    fno_only: bool = Query(False, description="Only symbols listed in tickers.csv"),
+    security_type: str = Query("NONE", pattern="^(Nifty|2\\.5%|Others|NONE)$"),
+    security: str = Query("All"),
+    symbol: str = Query("All"),
+):
+    with profiling.profiled_run("api_screener"):
+        with profiling.stage("dataset"):
+            dataset = get_screener_dataset()
+        if dataset["df"] is None:
+            raise HTTPException(status_code=404, detail="Price data not found")
+
+        with profiling.stage("screener", rows_in=len(dataset["df"])) as record:
+            table = engine.cached_screener(
+                dataset["df"], dataset["version"], dataset["yesterday_open_price"], days, gain_threshold,
+                security_type, security, symbol.upper() if symbol != "All" else symbol,
+                fno_only, dataset["ticker_symbols"], min_close,
+            )
+            record["rows_out"] = len(table)
+    body = {
+        "as_of": engine.from_date_key([dataset["df"]["DATE"].max()])[0].strftime("%Y-%m-%d"),
+        "count": len(table),
+        "rows": json.loads(table.to_json(orient="records")),
+    }
+    return Response(json.dumps(body), media_type=MEDIA_TYPES["json"])
+
+@app.get("/api/screener/cache")
+def get_screener_cache_stats():
+    return engine.screener_cache.stats()
+
+@app.get("/api/ingest")
+def get_ingest_status():
+    return ingest_jobs.status()
+
+@app.post("/api/ingest", status_code=202)
+def start_ingest(
+    full_rebuild: bool = Query(False, description="Re-merge all ZIP files"),
+    workers: int = Query(1, ge=1, le=os.cpu_count() or 1, description="Ingestion worker processes"),
+    write_csv: bool = Query(True, description="Also export merged_output.csv"),
+):
+    # Returns the job serving this request: a queued or running job that covers it, or a new one
+    return ingest_jobs.submit(incremental=not full_rebuild, workers=workers, write_csv=write_csv).to_dict()
+
+@app.get("/api/ingest/{job_id}")
+def get_ingest_job(job_id: int):
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return job.to_dict()
+
+@app.get("/api/metrics")
+def get_metrics(
+    run: str = Query(None, description="Only runs with this name (e.g. process_zip_files, api_screener)"),
+    limit: int = Query(20, ge=1, le=profiling.MAX_RUNS),
+):
+    return {
+        "enabled": profiling.PROFILING_ENABLED,
+        "summary": profiling.summarize_runs(),
+        "runs": profiling.get_runs(run, limit),
+        "screener_cache": engine.screener_cache.stats(),
+        "watcher": zip_watcher.status() if zip_watcher is not None else None,
+        "ingest": ingest_jobs.status(),
+    }
@@ -0,0 +1,151 @@
+# backtest.py
+# Historical backtest of the gain screener: evaluates the day-wise gain and continuous-gain rules as
+# of every trading date in a range in one vectorized pass over the history (no re-slicing per date),
+# and attaches the forward returns that followed each hit.
+#
+# A security is evaluated on the dates it traded. On such a date its result equals what the
+# screener (run_screener) would have shown with the data cut off at that date.
+import numpy as np
+import pandas as pd
+import engine
+
+FORWARD_DAYS = [1, 3, 5]  # Forward returns (in trading sessions of the security) attached to each hit
+CONTINUOUS_GAIN_DAYS = 5  # Window of the continuous-gain rule, as in run_screener
+
+# Function to sort the rows by group and DATE and find, for each sorted row, the sorted positions of
+# the first and last row of its group. Returns (order, group codes, starts, ends) over sorted rows.
+def sorted_groups(groups, dates, mask=None):
+    order, codes, _ = engine.group_order(groups, dates, mask)
+    positions = np.arange(len(codes))
+    new_group = np.r_[True, codes[1:] != codes[:-1]] if len(codes) else np.array([], dtype=bool)
+    starts = np.maximum.accumulate(np.where(new_group, positions, 0)) if len(codes) else positions
+    group_ends = np.r_[np.flatnonzero(new_group)[1:], len(codes)]
+    ends = np.repeat(group_ends, np.diff(np.r_[np.flatnonzero(new_group), len(codes)])) - 1
+    return order, codes, starts, ends
+
+# Function to compute the day-wise gain as of every row: from the LOW_PRICE `days` rows back (the
+# first row when there is less history) to the row's CLOSE_PRICE. Returns (low, gain) per original
+# row, NaN for rows outside `mask` and for all but the last row of a SECURITY listed more than once
+# on a date (the screener reports only that one).
+def rolling_daywise_gain(df, days, mask=None):
+    order, codes, starts, _ = sorted_groups(df['SECURITY'], df['DATE'], mask)
+    dates = df['DATE'].to_numpy()[order]
+    last_of_day = np.r_[(codes[1:] != codes[:-1]) | (dates[1:] != dates[:-1]), True][:len(order)]
+    anchor = order[np.maximum(starts, np.arange(len(order)) - (days - 1))]
+    low = np.full(len(df), np.nan)
+    close = np.full(len(df), np.nan)
+    low[order] = np.where(last_of_day, engine.widen_prices(df['LOW_PRICE'].to_numpy()[anchor]), np.nan)
+    close[order] = engine.widen_prices(df['CLOSE_PRICE'].to_numpy()[order])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gain = np.where(low != 0, ((close - low) / low) * 100, 0)
+    return low, np.where(np.isnan(low), np.nan, gain)
+
+# Function to compute the continuous gain as of every row, per instrument_key(): the rule of
+# calculate_continuous_gain() applied to the last `days` rows up to each row, using a
+# (rows x days) sliding window. Returns (CONTINUOUS_GAIN, STREAK_LENGTH) per original row.
+def rolling_continuous_gain(df, days=CONTINUOUS_GAIN_DAYS, mask=None):
+    order, _, starts, _ = sorted_groups(engine.instrument_key(df), df['DATE'], mask)
+    continuous_gain = np.full(len(df), np.nan)
+    streak_length = np.zeros(len(df), dtype=np.int64)
+    if len(order) == 0:
+        return continuous_gain, streak_length
+
+    # Window slot k of sorted row i is sorted row i - (days - 1) + k; slots before the group start are empty
+    positions = np.arange(len(order))
+    index = positions[:, None] - (days - 1) + np.arange(days)
+    valid = index >= starts[:, None]
+    index = np.where(valid, index, 0)
+    closes = engine.widen_prices(df['CLOSE_PRICE'].to_numpy()[order])[index]
+    opens = engine.widen_prices(df['OPEN_PRICE'].to_numpy()[order])[index]
+
+    # First slot (after the first valid one) whose close does not beat the previous close
+    breaks = np.zeros_like(valid)
+    breaks[:, 1:] = valid[:, 1:] & valid[:, :-1] & (closes[:, 1:] <= closes[:, :-1])
+    has_break = breaks.any(axis=1)
+    first_valid = valid.argmax(axis=1)
+    streak_start = np.where(has_break, breaks.argmax(axis=1), first_valid)
+    size = valid.sum(axis=1)
+
+    in_streak = np.arange(days) >= streak_start[:, None]
+    lowest_price = np.where(in_streak, opens, np.inf).min(axis=1)
+    latest_close = closes[:, -1]
+    # Trailing run of valid slots whose close beats the previous close
+    rising = valid[:, 1:] & valid[:, :-1] & (closes[:, 1:] > closes[:, :-1])
+    last_not_rising = np.where(~rising, np.arange(days - 1), -1).max(axis=1, initial=-1)
+
+    has_streak = (size >= 2) & (~has_break | (streak_start < days - 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gain_percent = np.where(lowest_price != 0, ((latest_close - lowest_price) / lowest_price) * 100, 0.0)
+    continuous_gain[order] = np.where(has_streak, np.round(gain_percent, 2), 0.0)
+    streak_length[order] = (days - 2) - last_not_rising
+    return continuous_gain, streak_length
+
+# Function to compute forward close-to-close returns (%) per SECURITY over `horizons` trading
+# sessions, from every row. NaN where the history ends before the horizon.
+def forward_returns(df, horizons=FORWARD_DAYS):
+    order, _, _, ends = sorted_groups(df['SECURITY'], df['DATE'])
+    closes = engine.widen_prices(df['CLOSE_PRICE'].to_numpy()[order])
+    positions = np.arange(len(order))
+    returns = {}
+    for horizon in horizons:
+        ahead = positions + horizon
+        result = np.full(len(df), np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result[order] = np.where(
+                ahead <= ends, (closes[np.minimum(ahead, len(order) - 1)] / closes - 1) * 100, np.nan
+            )
+        returns[horizon] = result
+    return returns
+
+# Function to backtest the screener over the last `as_of_days` trading dates of df: every row on
+# those dates that passes the screener filters with a day-wise gain at or above gain_threshold, with
+# its continuous gain and forward returns. Use gain_threshold=None to keep every evaluated row
+# (e.g. to sweep thresholds afterwards).
+def run_backtest(df, days=5, gain_threshold=1, as_of_days=250, security_type="NONE", security="All",
+                 symbol="All", fno_only=False, ticker_symbols=None, close_min=None, horizons=FORWARD_DAYS):
+    mask = engine.screener_mask(df, security_type, security, symbol, fno_only, ticker_symbols, close_min)
+    low, gain = rolling_daywise_gain(df, days, mask)
+    continuous_gain, streak_length = rolling_continuous_gain(df, mask=mask)
+    returns = forward_returns(df, horizons)
+
+    dates = np.sort(pd.unique(df['DATE'].to_numpy()))
+    selected = np.isin(df['DATE'].to_numpy(), dates[-as_of_days:]) & ~np.isnan(gain)
+    if gain_threshold is not None:
+        selected &= gain >= gain_threshold
+    rows = np.flatnonzero(selected)
+
+    hits = pd.DataFrame({
+        'DATE': df['DATE'].to_numpy()[rows],
+        'SECURITY': np.asarray(df['SECURITY'].to_numpy()[rows], dtype=object),
+        'SYMBOL': np.asarray(df['SYMBOL'].to_numpy()[rows], dtype=object),
+        'LOW_PRICE': low[rows],
+        'CLOSE_PRICE': engine.widen_prices(df['CLOSE_PRICE'].to_numpy()[rows]),
+        'GAIN_PERCENT': gain[rows],
+        'CONTINUOUS_GAIN': continuous_gain[rows],
+        'STREAK_LENGTH': streak_length[rows],
+    })
+    for horizon in horizons:
+        hits[f'FWD_RETURN_{horizon}D'] = returns[horizon][rows]
+    if not pd.api.types.is_datetime64_any_dtype(hits['DATE']):
+        hits['DATE'] = engine.from_date_key(hits['DATE'].to_numpy())
+    return hits.sort_values(['DATE', 'SECURITY'], kind='stable').reset_index(drop=True)
+
+# Function to summarize backtest rows (run with gain_threshold=None) for several gain thresholds:
+# hit count, distinct as-of dates, and the mean, median and win rate of each forward return
+def sweep_thresholds(backtest, thresholds):
+    forward_columns = [col for col in backtest.columns if col.startswith('FWD_RETURN_')]
+    summary = []
+    for threshold in thresholds:
+        hits = backtest[backtest['GAIN_PERCENT'] >= threshold]
+        row = {'GAIN_THRESHOLD': threshold, 'HITS': len(hits), 'DATES': hits['DATE'].nunique()}
+        for col in forward_columns:
+            returns = hits[col].dropna()
+            row[f'{col}_MEAN'] = returns.mean()
+            row[f'{col}_MEDIAN'] = returns.median()
+            row[f'{col}_WIN_RATE'] = (returns > 0).mean() if len(returns) else np.nan
+        summary.append(row)
+    return pd.DataFrame(summary)
+
+# Function to load enough history for a backtest over the last `as_of_days` trading dates
+def load_backtest_frame(as_of_days=250, fno_list=None):
+    return engine.load_screener_frame(fno_list, lookback=as_of_days + engine.SCREENER_LOOKBACK_DAYS)
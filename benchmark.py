@@ -0,0 +1,234 @@
+# benchmark.py
+# Benchmark harness: generates synthetic PRddmmyy.zip bhavcopies in the real Pd*.csv layout and
+# times every stage of ingestion and screening, writing machine-readable results.
+#
+#   python benchmark.py --years 1 5 10 --securities 3000
+#   python benchmark.py --compare output/benchmark/results/a.json output/benchmark/results/b.json
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import zipfile
+from datetime import date, datetime, timedelta
+import numpy as np
+import pandas as pd
+from profiling import current_rss
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_DIR = os.path.join(REPO_DIR, "output", "benchmark")
+FNO_CSV_PATH = os.path.join(REPO_DIR, "data", "FO_SECURITY.csv")
+INDEX_NAMES = ["Nifty 50", "Nifty Next 50", "Nifty 100", "Nifty 200", "Nifty 500", "Nifty Bank"]
+END_DATE = date(2025, 3, 28)  # Fixed so that generated data is reproducible
+TRADING_DAYS_PER_YEAR = 250
+
+# Function to list `years` worth of weekday trade dates ending at END_DATE
+def trade_dates(years):
+    dates = []
+    day = END_DATE
+    while len(dates) < years * TRADING_DAYS_PER_YEAR:
+        if day.weekday() < 5:
+            dates.append(day)
+        day -= timedelta(days=1)
+    return dates[::-1]
+
+# Function to build the synthetic security list: real F&O names first (so the F&O filter has
+# matches), then generated names
+def synthetic_securities(count):
+    fno = pd.read_csv(FNO_CSV_PATH)
+    symbols = fno['SYMBOL'].str.upper().tolist()[:count]
+    names = fno['SECURITY'].str.upper().tolist()[:count]
+    for i in range(len(symbols), count):
+        symbols.append(f"SYN{i:05d}")
+        names.append(f"SYNTHETIC{i:05d} INDUSTRIES LIMITED")
+    return symbols, names
+
+# Function to format prices the way NSE does: right-aligned in a 13 character field
+def padded(values):
+    return np.char.mod("%13.2f", values)
+
+# Function to write one synthetic archive with a Pd*.csv in the NSE layout (space-padded prices,
+# index rows with a blank SYMBOL, a section row with blank prices)
+def write_bhavcopy_zip(folder, trade_date, symbols, names, opens, highs, lows, closes, prev_closes):
+    rows = len(symbols)
+    df = pd.DataFrame({
+        'MKT': ['Y'] * len(INDEX_NAMES) + ['N'] * rows,
+        'SERIES': [' '] * len(INDEX_NAMES) + ['EQ'] * rows,
+        'SYMBOL': [' '] * len(INDEX_NAMES) + symbols,
+        'SECURITY': INDEX_NAMES + names,
+        'PREV_CL_PR': np.r_[padded(prev_closes[:len(INDEX_NAMES)] * 50), padded(prev_closes)],
+        'OPEN_PRICE': np.r_[padded(opens[:len(INDEX_NAMES)] * 50), padded(opens)],
+        'HIGH_PRICE': np.r_[padded(highs[:len(INDEX_NAMES)] * 50), padded(highs)],
+        'LOW_PRICE': np.r_[padded(lows[:len(INDEX_NAMES)] * 50), padded(lows)],
+        'CLOSE_PRICE': np.r_[padded(closes[:len(INDEX_NAMES)] * 50), padded(closes)],
+        'NET_TRDVAL': np.r_[np.zeros(len(INDEX_NAMES)), np.round(closes * 10000, 2)],
+        'NET_TRDQTY': np.r_[np.zeros(len(INDEX_NAMES), dtype=int), np.full(rows, 10000)],
+        'IND_SEC': ['Y'] * len(INDEX_NAMES) + ['N'] * rows,
+        'CORP_IND': ' ',
+        'TRADES': np.r_[np.zeros(len(INDEX_NAMES), dtype=int), np.full(rows, 500)],
+        'HI_52_WK': np.r_[padded(highs[:len(INDEX_NAMES)] * 60), padded(highs * 1.3)],
+        'LO_52_WK': np.r_[padded(lows[:len(INDEX_NAMES)] * 40), padded(lows * 0.7)],
+    })
+    section = pd.DataFrame([{col: ' ' for col in df.columns}])
+    section['SERIES'] = 'EQ'
+    section['SECURITY'] = 'COMPULSORY ROLLING STOCKS'
+    df = pd.concat([df.iloc[:len(INDEX_NAMES)], section, df.iloc[len(INDEX_NAMES):]], ignore_index=True)
+
+    stamp = trade_date.strftime("%d%m%y")
+    with zipfile.ZipFile(os.path.join(folder, f"PR{stamp}.zip"), "w", zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.writestr(f"Pd{stamp}.csv", df.to_csv(index=False))
+
+# Function to generate (or reuse) a synthetic zip/ folder for years x securities
+def generate_bhavcopies(folder, years, securities, seed=42):
+    dates = trade_dates(years)
+    os.makedirs(folder, exist_ok=True)
+    if len([f for f in os.listdir(folder) if f.endswith(".zip")]) == len(dates):
+        return len(dates)
+
+    rng = np.random.default_rng(seed)
+    symbols, names = synthetic_securities(securities)
+    # Geometric random walk per security
+    closes = np.round(rng.uniform(20, 3000, securities) * np.exp(np.cumsum(rng.normal(0, 0.02, (len(dates), securities)), axis=0)), 2)
+    prev_closes = np.vstack([closes[:1], closes[:-1]])
+    opens = np.round(prev_closes * (1 + rng.normal(0, 0.005, closes.shape)), 2)
+    highs = np.round(np.maximum(opens, closes) * (1 + np.abs(rng.normal(0, 0.01, closes.shape))), 2)
+    lows = np.round(np.minimum(opens, closes) * (1 - np.abs(rng.normal(0, 0.01, closes.shape))), 2)
+    for i, trade_date in enumerate(dates):
+        write_bhavcopy_zip(folder, trade_date, symbols, names, opens[i], highs[i], lows[i], closes[i], prev_closes[i])
+    return len(dates)
+
+# Function to run one stage, recording wall time, row counts and peak memory. Memory is the
+# peak resident set size above the level at the start of the stage, sampled from a background
+# thread (tracemalloc would slow the pandas stages down several times and distort the timings).
+def run_stage(results, name, func, rows_in=None):
+    start_rss = current_rss()
+    peak_rss = [start_rss]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.005):
+            peak_rss[0] = max(peak_rss[0], current_rss())
+
+    sampler = threading.Thread(target=sample, daemon=True) if start_rss is not None else None
+    if sampler:
+        sampler.start()
+    start = time.perf_counter()
+    value = func()
+    seconds = time.perf_counter() - start
+    done.set()
+    if sampler:
+        sampler.join()
+        peak_mb = round((max(peak_rss[0], current_rss()) - start_rss) / (1024 * 1024), 1)
+    else:
+        peak_mb = None
+
+    rows_out = len(value) if hasattr(value, "__len__") and not isinstance(value, (str, tuple, dict)) else None
+    results[name] = {
+        "seconds": round(seconds, 4),
+        "peak_mb": peak_mb,
+        "rows_in": rows_in,
+        "rows_out": rows_out,
+    }
+    print(f"  {name:<22} {seconds:9.3f}s  peak +{peak_mb if peak_mb is not None else '?':>8} MB", flush=True)
+    return value
+
+# Function to benchmark every stage for one synthetic data size
+def benchmark_size(bench_dir, years, securities, workers, write_csv):
+    workdir = os.path.join(bench_dir, f"{years}y_{securities}s")
+    archives = generate_bhavcopies(os.path.join(workdir, "zip"), years, securities)
+    print(f"{years} year(s) x {securities} securities: {archives} archives", flush=True)
+
+    # engine resolves zip/ and output/ relative to the working directory
+    os.chdir(workdir)
+    import engine
+    fno_list = pd.read_csv(FNO_CSV_PATH)['SECURITY'].str.split().str[0].str.upper().str.strip().tolist()
+
+    stages = {}
+    run_stage(stages, "ingest_full", lambda: engine.process_zip_files(incremental=False, workers=workers, write_csv=write_csv))
+    run_stage(stages, "ingest_noop", lambda: engine.process_zip_files(workers=workers, write_csv=write_csv))
+    columns = ['SECURITY_ID', 'OPEN_PRICE', 'HIGH_PRICE', 'LOW_PRICE', 'CLOSE_PRICE', 'DATE']
+    run_stage(stages, "load_screener_window", lambda: engine.load_screener_frame(fno_list))
+    df = run_stage(stages, "load", lambda: engine.load_price_data(columns=columns))
+    rows = len(df)
+
+    master = engine.load_security_master()
+    df = run_stage(stages, "clean", lambda: engine.compact_price_frame(df.dropna(subset=columns[1:]), master), rows)
+    bytes_per_row = round(df.memory_usage(deep=True).sum() / max(len(df), 1), 1)
+    df = run_stage(stages, "fno_filter", lambda: engine.filter_first_word_partial(df, fno_list), len(df))
+    run_stage(stages, "daywise_gain", lambda: engine.calculate_daywise_gain(df, [1, 2, 3, 5, 30])[5], len(df))
+    run_stage(stages, "continuous_gain", lambda: engine.calculate_continuous_gain(df), len(df))
+    yesterday_open_price = run_stage(stages, "latest_open", lambda: engine.latest_open_prices(df), len(df))
+    run_stage(
+        stages, "screener",
+        lambda: engine.run_screener(df, 5, 1, yesterday_open_price, engine.screener_mask(df, close_min=10)),
+        len(df),
+    )
+    os.chdir(REPO_DIR)
+    return {"years": years, "securities": securities, "archives": archives, "rows": rows, "bytes_per_row": bytes_per_row, "stages": stages}
+
+# Function to get the current git commit (None outside a git checkout)
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Function to print stage-by-stage deltas between two result files
+def compare_results(old_path, new_path):
+    with open(old_path, encoding="utf-8") as f:
+        old = {(run["years"], run["securities"]): run for run in json.load(f)["runs"]}
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    for run in new["runs"]:
+        base = old.get((run["years"], run["securities"]))
+        if base is None:
+            continue
+        print(f"{run['years']} year(s) x {run['securities']} securities")
+        for stage, result in run["stages"].items():
+            if stage not in base["stages"]:
+                continue
+            before = base["stages"][stage]["seconds"]
+            change = (result["seconds"] / before - 1) * 100 if before else 0.0
+            print(f"  {stage:<22} {before:9.3f}s -> {result['seconds']:9.3f}s  ({change:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion and screening on synthetic bhavcopies")
+    parser.add_argument("--years", type=int, nargs="+", default=[1], help="History sizes to benchmark (e.g. 1 5 10)")
+    parser.add_argument("--securities", type=int, default=3000, help="Securities per trading day")
+    parser.add_argument("--workers", type=int, default=1, help="Ingestion worker processes")
+    parser.add_argument("--no-csv", action="store_true", help="Skip the merged_output.csv export while ingesting")
+    parser.add_argument("--workdir", default=BENCH_DIR, help="Where synthetic archives and outputs are kept")
+    parser.add_argument("--output", help="Result file (default: <workdir>/results/<commit>-<time>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_results(*args.compare)
+        return 0
+
+    results = {
+        "commit": git_commit(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "workers": args.workers,
+        "runs": [
+            benchmark_size(os.path.abspath(args.workdir), years, args.securities, args.workers, not args.no_csv)
+            for years in args.years
+        ],
+    }
+
+    output = args.output or os.path.join(args.workdir, "results", f"{results['commit'] or 'local'}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
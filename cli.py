@@ -0,0 +1,222 @@
+# cli.py
+# Headless command line for scheduled end-of-day runs: ingests new ZIP files from zip/ and runs the
+# screener for several parameter sets over one load of the data. Does not import Streamlit.
+#
+#   python cli.py ingest --workers 4
+#   python cli.py screen --set days=5,gain_threshold=2 --set days=30,security_type=Others --output eod.csv
+#   python cli.py run --sets-file screens.json --output output/eod.parquet
+#   python cli.py watch --interval 10
+#   python cli.py backtest --days 5 --thresholds 1 2 5 10 --as-of-days 250 --output output/backtest.parquet
+import argparse
+import asyncio
+import json
+import os
+import sys
+import pandas as pd
+import backtest
+import engine
+import watcher
+
+# Screener parameters a set can give, with their types and defaults (the defaults of the app sidebar)
+SET_FIELDS = {
+    "days": (int, 5),
+    "gain_threshold": (float, 1.0),
+    "security_type": (str, "NONE"),
+    "security": (str, "All"),
+    "symbol": (str, "All"),
+    "fno_only": (bool, False),
+    "close_min": (float, 10.0),
+}
+SECURITY_TYPES = ["Nifty", "2.5%", "Others", "NONE"]
+TYPE_NAMES = {int: "an integer", float: "a number", str: "a string", bool: "true or false"}
+
+# Parameters that may be left empty (or null in a sets file) to switch their filter off
+OPTIONAL_FIELDS = {"close_min"}
+
+# Function to turn a command-line or sets-file value into the type of a parameter
+def parse_value(field, value):
+    kind = SET_FIELDS[field][0]
+    if value is None or value == "":
+        if field in OPTIONAL_FIELDS:
+            return None
+        raise ValueError(f"{field} needs a value")
+    if kind is bool and isinstance(value, str):
+        if value.lower() not in ("1", "0", "true", "false", "yes", "no"):
+            raise ValueError(f"{field} must be true or false, got {value!r}")
+        return value.lower() in ("1", "true", "yes")
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be {TYPE_NAMES[kind]}, got {value!r}") from None
+
+# Function to validate one parameter set and fill in the defaults
+def normalize_set(params, index):
+    unknown = set(params) - set(SET_FIELDS) - {"name"}
+    if unknown:
+        raise ValueError(f"Set {index}: unknown parameter(s) {sorted(unknown)}")
+    normalized = {"name": str(params.get("name") or f"set{index}")}
+    for field, (_, default) in SET_FIELDS.items():
+        normalized[field] = parse_value(field, params[field]) if field in params else default
+    if not 1 <= normalized["days"] <= engine.SCREENER_LOOKBACK_DAYS:
+        raise ValueError(f"Set {index}: days must be between 1 and {engine.SCREENER_LOOKBACK_DAYS}")
+    if normalized["security_type"] not in SECURITY_TYPES:
+        raise ValueError(f"Set {index}: security_type must be one of {SECURITY_TYPES}")
+    return normalized
+
+# Function to collect the parameter sets from --set options and a --sets-file
+def read_parameter_sets(set_options, sets_file):
+    sets = []
+    if sets_file:
+        with open(sets_file, encoding="utf-8") as f:
+            file_sets = json.load(f)
+        if not isinstance(file_sets, list) or not all(isinstance(params, dict) for params in file_sets):
+            raise ValueError(f"{sets_file} must hold a JSON list of parameter objects")
+        sets.extend(file_sets)
+    for option in set_options or []:
+        params = {}
+        for item in option.split(","):
+            key, sep, value = item.partition("=")
+            if not sep:
+                raise ValueError(f"Expected KEY=VALUE in --set, got {item!r}")
+            params[key.strip()] = value.strip()
+        sets.append(params)
+    return [normalize_set(params, index) for index, params in enumerate(sets or [{}], start=1)]
+
+# Function to run every parameter set over one load of the screener frame. Returns one table with
+# the set name and parameters in front of the screener columns.
+def run_parameter_sets(parameter_sets):
+    fno_list = engine.read_fno_list()
+    if fno_list is None:
+        print("F&O securities file not found, screening all securities", file=sys.stderr)
+    df = engine.load_screener_frame(fno_list)
+    if df is None:
+        return None
+    yesterday_open_price = engine.latest_open_prices(df)
+    ticker_symbols = engine.read_ticker_symbols() or []
+
+    tables = []
+    for params in parameter_sets:
+        symbol = params["symbol"].upper() if params["symbol"] != "All" else params["symbol"]
+        mask = engine.screener_mask(
+            df, params["security_type"], params["security"], symbol, params["fno_only"], ticker_symbols,
+            params["close_min"],
+        )
+        table = engine.run_screener(df, params["days"], params["gain_threshold"], yesterday_open_price, mask)
+        tables.append(table.assign(**{"SET": params["name"], "DAYS": params["days"]}))
+    result = pd.concat(tables, ignore_index=True)
+    return result[['SET', 'DAYS'] + [col for col in result.columns if col not in ('SET', 'DAYS')]]
+
+# Function to write the result table as CSV or Parquet (by --format, else by the file extension)
+def write_result(df, path, fmt=None):
+    fmt = fmt or ("parquet" if path.endswith(".parquet") else "csv")
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    if fmt == "parquet":
+        engine.write_parquet_atomic(df, path)
+    else:
+        df.to_csv(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+
+# Function to report ingestion progress on stderr (only the wait for another run, to keep cron logs short)
+def report_progress(step, done, total, archive):
+    if step == "waiting":
+        print("Another ingestion run is in progress, waiting for it to finish...", file=sys.stderr, flush=True)
+
+def ingest(args):
+    success, message, _ = engine.process_zip_files(
+        incremental=not args.full, workers=args.workers, write_csv=not args.no_csv, progress=report_progress
+    )
+    print(message, file=sys.stdout if success else sys.stderr)
+    return 0 if success else 1
+
+def screen(args):
+    try:
+        parameter_sets = read_parameter_sets(args.set, args.sets_file)
+    except (OSError, ValueError) as e:
+        print(f"Invalid parameter sets: {e}", file=sys.stderr)
+        return 2
+    result = run_parameter_sets(parameter_sets)
+    if result is None:
+        print("Price data not found. Run the ingest command first.", file=sys.stderr)
+        return 1
+    write_result(result, args.output, args.format)
+    print(f"Wrote {len(result)} row(s) for {len(parameter_sets)} parameter set(s) to {args.output}")
+    return 0
+
+def run(args):
+    status = ingest(args)
+    return status if status else screen(args)
+
+def run_backtest(args):
+    if not 1 <= args.days <= engine.SCREENER_LOOKBACK_DAYS:
+        print(f"--days must be between 1 and {engine.SCREENER_LOOKBACK_DAYS}", file=sys.stderr)
+        return 2
+    fno_list = engine.read_fno_list()
+    df = backtest.load_backtest_frame(args.as_of_days, fno_list)
+    if df is None:
+        print("Price data not found. Run the ingest command first.", file=sys.stderr)
+        return 1
+    evaluated = backtest.run_backtest(
+        df, args.days, None, args.as_of_days, args.security_type, fno_only=args.fno_only,
+        ticker_symbols=engine.read_ticker_symbols() or [], close_min=args.close_min,
+    )
+    summary = backtest.sweep_thresholds(evaluated, args.thresholds)
+    print(summary.to_string(index=False))
+    hits = evaluated[evaluated['GAIN_PERCENT'] >= min(args.thresholds)]
+    write_result(hits, args.output, args.format)
+    if args.summary:
+        write_result(summary, args.summary)
+    print(f"Wrote {len(hits)} hit(s) over {hits['DATE'].nunique()} date(s) to {args.output}")
+    return 0
+
+def watch(args):
+    zip_watcher = watcher.ZipWatcher(args.interval, args.settle, args.workers, not args.no_csv)
+    try:
+        asyncio.run(zip_watcher.run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest NSE bhavcopies and run the gain screener without the UI")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_options = argparse.ArgumentParser(add_help=False)
+    ingest_options.add_argument("--full", action="store_true", help="Full rebuild (re-merge all ZIP files)")
+    ingest_options.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Ingestion worker processes")
+    ingest_options.add_argument("--no-csv", action="store_true", help="Skip the merged_output.csv export")
+
+    screen_options = argparse.ArgumentParser(add_help=False)
+    screen_options.add_argument(
+        "--set", action="append", metavar="KEY=VALUE[,KEY=VALUE...]",
+        help=f"One parameter set (repeatable). Keys: name, {', '.join(SET_FIELDS)}",
+    )
+    screen_options.add_argument("--sets-file", help="JSON file with a list of parameter set objects")
+    screen_options.add_argument("--output", default=os.path.join(engine.output_folder, "screener.csv"), help="Result file")
+    screen_options.add_argument("--format", choices=["csv", "parquet"], help="Result format (default: by extension)")
+
+    subparsers.add_parser("ingest", parents=[ingest_options], help="Ingest new ZIP files from zip/").set_defaults(func=ingest)
+    subparsers.add_parser("screen", parents=[screen_options], help="Run the screener for parameter sets").set_defaults(func=screen)
+    subparsers.add_parser("run", parents=[ingest_options, screen_options], help="Ingest, then screen").set_defaults(func=run)
+    watch_parser = subparsers.add_parser("watch", parents=[ingest_options], help="Ingest new ZIP files as they arrive in zip/")
+    watch_parser.add_argument("--interval", type=float, default=5.0, help="Seconds between polls of zip/")
+    watch_parser.add_argument("--settle", type=float, default=3.0, help="Seconds an archive must stay unchanged before it is ingested")
+    watch_parser.set_defaults(func=watch)
+
+    backtest_parser = subparsers.add_parser("backtest", help="Replay the screener over past dates with forward returns")
+    backtest_parser.add_argument("--days", type=int, default=5, help="Day range of the gain")
+    backtest_parser.add_argument("--thresholds", type=float, nargs="+", default=[1.0], help="Gain %% thresholds to sweep")
+    backtest_parser.add_argument("--as-of-days", type=int, default=250, help="Trading dates to evaluate, counting back from the latest")
+    backtest_parser.add_argument("--close-min", type=float, default=10.0, help="Minimum CLOSE_PRICE")
+    backtest_parser.add_argument("--security-type", choices=SECURITY_TYPES, default="NONE")
+    backtest_parser.add_argument("--fno-only", action="store_true", help="Only symbols listed in tickers.csv")
+    backtest_parser.add_argument("--output", default=os.path.join(engine.output_folder, "backtest.csv"), help="Hits at the lowest threshold")
+    backtest_parser.add_argument("--format", choices=["csv", "parquet"], help="Hits format (default: by extension)")
+    backtest_parser.add_argument("--summary", help="Also write the threshold sweep to this file")
+    backtest_parser.set_defaults(func=run_backtest)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
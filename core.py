@@ -1,118 +1,102 @@
 import os
+import time
 import pandas as pd
-import re
-import zipfile
-import shutil
 import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
-
-# Define directories
-source_folder = "zip"
-output_folder = "output"
-merged_file_path = os.path.join(output_folder, "merged_output.csv")
-fno_file_path = "data/FO_SECURITY.xlsx"  # F&O securities file
-tickers_file_path = "data/tickers.csv"  # New tickers file for SYMBOL matching
-
-# Ensure directories exist
-os.makedirs(source_folder, exist_ok=True)
-os.makedirs(output_folder, exist_ok=True)
-
-# Function to extract date (from bhav.py)
-def extract_date(folder_name):
-    match = re.search(r"(\d{2})(\d{2})(\d{2})$", folder_name.split(".")[0])
-    if match:
-        day, month, year = match.groups()
-        year = "20" + year if int(year) <= 50 else "19" + year
-        month_names = {
-            "01": "JAN", "02": "FEB", "03": "MAR", "04": "APR", "05": "MAY", "06": "JUN",
-            "07": "JUL", "08": "AUG", "09": "SEP", "10": "OCT", "11": "NOV", "12": "DEC"
-        }
-        month = month_names.get(month, month)
-        return f"{day}-{month}-{year}"
-    return ""
-
-# Function to process ZIP files (bhav.py logic)
-def process_zip_files():
-    merged_data = []
-    for zip_file in os.listdir(source_folder):
-        if zip_file.endswith(".zip"):
-            zip_path = os.path.join(source_folder, zip_file)
-            extract_folder = os.path.join(output_folder, zip_file.replace(".zip", ""))
-            os.makedirs(extract_folder, exist_ok=True)
-            
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(extract_folder)
-            
-            formatted_date = extract_date(zip_file)
-            
-            for root, _, files in os.walk(extract_folder):
-                for file in files:
-                    if file.startswith("Pd") and file.endswith(".csv"):
-                        file_path = os.path.join(root, file)
-                        df = pd.read_csv(file_path)
-                        
-                        # Apply logic: Remove columns A, B, C and J to P
-                        df.drop(df.columns[[0, 1] + list(range(9, 16))], axis=1, inplace=True)
-                        
-                        # Add DATE column
-                        df["DATE"] = formatted_date
-                        
-                        merged_data.append(df)
-            
-            shutil.rmtree(extract_folder)
-
-    if merged_data:
-        final_df = pd.concat(merged_data, ignore_index=True)
-        final_df.to_csv(merged_file_path, index=False)
-        return True, f"✅ Merged CSV saved at: {merged_file_path}", final_df
-    return False, "No valid CSV files found for processing.", None
-
-# Function to calculate continuous green candles percentage gain from lowest point
-def calculate_continuous_gain(df, days=5):
-    df_sorted = df.sort_values(['SYMBOL', 'DATE'])
-    continuous_gain_data = {}
-    
-    for symbol, group in df_sorted.groupby('SYMBOL'):
-        # Get the last 5 days of data (or less if not available)
-        group = group.tail(days)
-        if len(group) < 2:  # Need at least 2 days to compare
-            continuous_gain_data[symbol] = 0.0
-            continue
-            
-        # Check continuous gains and calculate percentage from lowest point
-        closes = group['CLOSE_PRICE'].values
-        lows = group['OPEN_PRICE'].values
-        is_continuous_gain = True
-        start_idx = 0
-        
-        # Find the last sequence of continuous gains
-        for i in range(1, len(closes)):
-            if closes[i] <= closes[i-1]:
-                is_continuous_gain = False
-                start_idx = i
-                break
-        
-        if is_continuous_gain and len(closes) > 1:
-            # If all days are continuous gains, use the lowest low price
-            lowest_price = min(lows)
-            latest_close = closes[-1]
-            gain_percent = ((latest_close - lowest_price) / lowest_price) * 100 if lowest_price != 0 else 0.0
-            continuous_gain_data[symbol] = round(gain_percent, 2)
-        elif start_idx < len(closes) - 1:
-            # Calculate gain from the low of the first candle in the last continuous sequence
-            lowest_price = min(lows[start_idx:])
-            latest_close = closes[-1]
-            gain_percent = ((latest_close - lowest_price) / lowest_price) * 100 if lowest_price != 0 else 0.0
-            continuous_gain_data[symbol] = round(gain_percent, 2)
-        else:
-            continuous_gain_data[symbol] = 0.0
-    
-    return continuous_gain_data
+import jobs
+import profiling
+import engine
+
+# Number of times each cached loader actually ran (a cache miss)
+cache_misses = {}
+
+# Function to call a cached loader and record whether it was a cache hit or miss and how long it took
+def timed_cache_call(timings, label, loader, *args):
+    misses = cache_misses.get(loader.__name__, 0)
+    start = time.perf_counter()
+    result = loader(*args)
+    status = "miss" if cache_misses.get(loader.__name__, 0) != misses else "hit"
+    timings.append((label, status, time.perf_counter() - start))
+    return result
+
+# Function to run engine.cached_screener() and record whether the table came from the LRU cache
+def timed_screener_call(timings, *args):
+    hits = engine.screener_cache.hits
+    start = time.perf_counter()
+    result = engine.cached_screener(*args)
+    timings.append(("Screener", "hit" if engine.screener_cache.hits != hits else "miss", time.perf_counter() - start))
+    return result
+
+# Function to load, clean and F&O-filter the compact price frame once per data and F&O file
+# version. The cached frame is shared between reruns and sessions without copying, so callers must
+# not modify it in place.
+@st.cache_resource(max_entries=1, show_spinner="Loading price data...")
+def load_clean_price_data(version, fno_version):
+    cache_misses["load_clean_price_data"] = cache_misses.get("load_clean_price_data", 0) + 1
+    return engine.load_screener_frame(load_fno_list(fno_version))
+
+# Function to load the full price history of one security (for the candlestick chart), read with
+# the security pushed down to the store
+@st.cache_data(max_entries=16, show_spinner="Loading price history...")
+def load_security_history(version, security):
+    cache_misses["load_security_history"] = cache_misses.get("load_security_history", 0) + 1
+    return engine.load_screener_frame(lookback=None, security=security)
+
+# Function to load the F&O first words once per FO_SECURITY.xlsx version
+@st.cache_data(show_spinner=False)
+def load_fno_list(version):
+    cache_misses["load_fno_list"] = cache_misses.get("load_fno_list", 0) + 1
+    return engine.read_fno_list()
+
+# Function to load the tickers.csv symbols once per file version
+@st.cache_data(show_spinner=False)
+def load_ticker_symbols(version):
+    cache_misses["load_ticker_symbols"] = cache_misses.get("load_ticker_symbols", 0) + 1
+    return engine.read_ticker_symbols()
+
+# Function to get the ingestion job manager shared by every session of this app process, so
+# concurrent users join one run instead of starting competing ones
+@st.cache_resource
+def get_ingest_jobs():
+    return jobs.IngestJobManager()
+
+# Function to save an uploaded archive to zip/ (written to a temporary file and swapped in, so an
+# ingestion run never reads a partial archive). Unchanged archives are not rewritten on reruns.
+def save_uploaded_zip(uploaded_file):
+    zip_path = os.path.join(engine.source_folder, uploaded_file.name)
+    data = uploaded_file.getbuffer()
+    if os.path.exists(zip_path) and os.path.getsize(zip_path) == len(data):
+        with open(zip_path, "rb") as f:
+            if f.read() == data:
+                return
+    with open(zip_path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(zip_path + ".tmp", zip_path)
+
+# Function to show the progress of the ingestion job in progress (refreshed every second). Reruns
+# the whole app once the job is done, so every session picks up the new data.
+def show_ingest_progress(ingest_jobs):
+    active = ingest_jobs.active()
+    if active is None:
+        st.rerun()
+    if active["state"] == "queued":
+        st.info("Ingestion queued...")
+        return
+    label = active.get("label") or "Starting ingestion"
+    if active.get("total"):
+        detail = f" ({active['done']}/{active['total']} archives)"
+        if active.get("archive"):
+            detail += f", last read: {active['archive']}"
+        st.progress(active["done"] / active["total"], text=label + detail)
+    else:
+        st.progress(0, text=label + "...")
 
 # Streamlit App
+@profiling.profiled("run_app")
 def run_app():
     st.title("📊 Equity Data Analyzer Tool")
+    engine.ensure_folders()
 
     # ZIP File Uploader
     st.sidebar.header("Upload ZIP Files")
@@ -120,76 +104,63 @@ def run_app():
     
     if uploaded_files:
         for uploaded_file in uploaded_files:
-            zip_path = os.path.join(source_folder, uploaded_file.name)
-            with open(zip_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-            st.sidebar.success(f"Saved {uploaded_file.name} to {source_folder}")
+            save_uploaded_zip(uploaded_file)
+            st.sidebar.success(f"Saved {uploaded_file.name} to {engine.source_folder}")
 
-    # Process Data Button
+    # Process Data Button (ingestion runs as a background job shared by all sessions)
+    ingest_jobs = get_ingest_jobs()
+    full_rebuild = st.sidebar.checkbox("Full rebuild (re-merge all ZIP files)", value=False)
+    ingest_workers = st.sidebar.number_input("Ingestion workers", min_value=1, max_value=os.cpu_count() or 1, value=os.cpu_count() or 1)
     if st.sidebar.button("Process ZIP Files"):
-        with st.spinner("Processing ZIP files..."):
-            success, message, final_df = process_zip_files()
-            if success:
-                st.success(message)
-                st.download_button(
-                    label="Download Merged CSV",
-                    data=final_df.to_csv(index=False).encode('utf-8'),
-                    file_name="merged_output.csv"
-                )
-            else:
-                st.error(message)
-
-    # Check if merged CSV exists
-    if not os.path.exists(merged_file_path):
-        st.error("❌ Merged CSV not found. Please upload ZIP files and process them first.")
+        job = ingest_jobs.submit(incremental=not full_rebuild, workers=int(ingest_workers))
+        st.session_state["ingest_job"] = job.id
+
+    if ingest_jobs.active() is not None:
+        st.fragment(show_ingest_progress, run_every=1)(ingest_jobs)
+    job = ingest_jobs.get(st.session_state.get("ingest_job"))
+    if job is not None and job.finished.is_set():
+        # Report the result of this session's job once, as the button used to
+        del st.session_state["ingest_job"]
+        if job.state == "succeeded":
+            st.success(job.message)
+            if os.path.exists(engine.merged_file_path):
+                with open(engine.merged_file_path, "rb") as f:
+                    st.download_button(
+                        label="Download Merged CSV",
+                        data=f.read(),
+                        file_name="merged_output.csv"
+                    )
+        else:
+            st.error(job.message)
+
+    # Load the F&O list, the main data (already limited to F&O first words) and tickers (cached
+    # until the underlying files change)
+    cache_timings = []
+    with profiling.stage("load_fno_list"):
+        fno_list = timed_cache_call(cache_timings, "F&O list", load_fno_list, engine.file_version(engine.fno_file_path))
+
+    with profiling.stage("load_price_data") as record:
+        df = timed_cache_call(cache_timings, "Price data", load_clean_price_data, engine.data_version(), engine.file_version(engine.fno_file_path))
+        record["rows_out"] = None if df is None else len(df)
+    if df is None:
+        st.error("❌ Price data not found. Please upload ZIP files and process them first.")
         return
 
-    # Load the main data
-    df = pd.read_csv(merged_file_path)
-
-    # Load F&O Securities
-    if os.path.exists(fno_file_path):
-        df_fno = pd.read_excel(fno_file_path)
-        df_fno['FIRST_WORD'] = df_fno['SECURITY'].str.split().str[0].str.upper().str.strip()
-        fno_list = df_fno['FIRST_WORD'].tolist()
-    else:
+    if fno_list is None:
         st.error("❌ F&O securities file not found.")
-        fno_list = []
 
-    # Load tickers.csv for SYMBOL matching
-    ticker_symbols = []
-    if os.path.exists(tickers_file_path):
-        df_tickers = pd.read_csv(tickers_file_path)
-        if 'SYMBOL' in df_tickers.columns:
-            ticker_symbols = df_tickers['SYMBOL'].str.upper().str.strip().tolist()
-        else:
-            st.warning("⚠️ 'SYMBOL' column not found in tickers.csv")
-    else:
+    with profiling.stage("load_tickers"):
+        ticker_symbols = timed_cache_call(cache_timings, "Tickers", load_ticker_symbols, engine.file_version(engine.tickers_file_path))
+    if ticker_symbols is None:
         st.warning("⚠️ tickers.csv file not found at data/tickers.csv")
-
-    # Clean and Prepare Data
-    df = df.dropna(subset=['LOW_PRICE', 'HIGH_PRICE', 'CLOSE_PRICE', 'OPEN_PRICE', 'DATE', 'SYMBOL'])
-    df['CLOSE_PRICE'] = pd.to_numeric(df['CLOSE_PRICE'], errors='coerce')
-    df['OPEN_PRICE'] = pd.to_numeric(df['OPEN_PRICE'], errors='coerce')
-    df['LOW_PRICE'] = pd.to_numeric(df['LOW_PRICE'], errors='coerce')
-    df['HIGH_PRICE'] = pd.to_numeric(df['HIGH_PRICE'], errors='coerce')
-    df['DATE'] = pd.to_datetime(df['DATE'], format='%d-%b-%Y', errors='coerce')
-    df['FIRST_WORD'] = df['SECURITY'].str.split().str[0].str.upper().str.strip().fillna('')
-    df['SYMBOL'] = df['SYMBOL'].astype(str).str.upper().str.strip()
-
-    # Filter by first-word with partial matching
-    def filter_first_word_partial(df, fno_list):
-        if not fno_list:
-            return df
-        mask = df['FIRST_WORD'].apply(lambda x: any(fno in x for fno in fno_list))
-        return df[mask]
-
-    df = filter_first_word_partial(df, fno_list)
+        ticker_symbols = []
+    elif not ticker_symbols:
+        st.warning("⚠️ 'SYMBOL' column not found in tickers.csv")
 
     # Calculate the most recent OPEN_PRICE for each SYMBOL
-    df_sorted_by_date = df.sort_values('DATE')
-    yesterday_open_price = df_sorted_by_date.groupby('SYMBOL')['OPEN_PRICE'].last().reset_index()
-    yesterday_open_price.rename(columns={'OPEN_PRICE': 'YESTERDAY_OPEN_PRICE'}, inplace=True)
+    with profiling.stage("latest_open", rows_in=len(df)) as record:
+        yesterday_open_price = engine.latest_open_prices(df)
+        record["rows_out"] = len(yesterday_open_price)
 
     # Sidebar Filters
     st.sidebar.header("Filters")
@@ -201,78 +172,40 @@ def run_app():
     show_fno_only = st.sidebar.checkbox("Show only F&O Securities (match SYMBOL with tickers.csv)", value=False)
     
     if day_range == "Custom":
-        custom_days = st.sidebar.number_input("Enter Custom Days", min_value=1, max_value=30, value=5)
+        custom_days = st.sidebar.number_input("Enter Custom Days", min_value=1, max_value=engine.SCREENER_LOOKBACK_DAYS, value=5)
         days = custom_days
     else:
         days = int(day_range.split()[0])
 
     close_price_filter = st.sidebar.text_input("Filter by CLOSE_PRICE (>=)", "10")
 
-    # Apply Filters
-    df_filtered = df.copy()
-
-    if security_type != "NONE":
-        if security_type == "Nifty":
-            df_filtered = df_filtered[df_filtered['SECURITY'].str.startswith("Nifty", na=False)]
-        elif security_type == "2.5%":
-            df_filtered = df_filtered[df_filtered['SECURITY'].str.startswith("2.5", na=False)]
-        elif security_type == "Others":
-            df_filtered = df_filtered[~df_filtered['SECURITY'].str.startswith(("Nifty", "2.5"), na=False)]
-
-    if security != "All":
-        df_filtered = df_filtered[df_filtered['SECURITY'] == security]
-
-    if symbol_filter != "All":
-        df_filtered = df_filtered[df_filtered['SYMBOL'] == symbol_filter]
-
-    if show_fno_only and ticker_symbols:
-        df_filtered = df_filtered[df_filtered['SYMBOL'].isin(ticker_symbols)]
+    with st.sidebar.expander("Charts"):
+        bar_limit = st.number_input("Max bars in gain chart", min_value=1, max_value=5000, value=engine.BAR_CHART_TOP_K)
+        candle_limit = st.number_input("Max candles before resampling", min_value=10, max_value=10000, value=engine.CANDLESTICK_MAX_POINTS)
 
+    close_price_value = None
     if close_price_filter:
         try:
             close_price_value = float(close_price_filter)
-            df_filtered = df_filtered[df_filtered['CLOSE_PRICE'] >= close_price_value]
         except ValueError:
             st.warning("Please enter a valid numeric value for CLOSE_PRICE filter")
 
-    # Function to calculate day-wise gain
-    def calculate_daywise_gain(df, days):
-        df_sorted = df.sort_values(['SECURITY', 'DATE'])
-        gain_data = []
-        for sec, group in df_sorted.groupby(['SECURITY']):
-            group = group.reset_index(drop=True)
-            if len(group) >= days:
-                low_price = group.iloc[-days]['LOW_PRICE']
-            else:
-                low_price = group['LOW_PRICE'].iloc[0]
-            close_price = group['CLOSE_PRICE'].iloc[-1]
-            gain_percent = ((close_price - low_price) / low_price) * 100 if low_price != 0 else 0
-            symbol = group['SYMBOL'].iloc[-1]
-            gain_data.append({
-                'SECURITY': sec,
-                'SYMBOL': symbol,
-                'LOW_PRICE': low_price,
-                'CLOSE_PRICE': close_price,
-                'GAIN_PERCENT': gain_percent
-            })
-        return pd.DataFrame(gain_data)
-
-    # Calculate gains based on filtered data
-    df_daywise = calculate_daywise_gain(df_filtered, days)
-    df_final_filtered = df_daywise[df_daywise['GAIN_PERCENT'] >= gain_threshold]
-
-    # Merge with yesterday_open_price
-    df_final_filtered = df_final_filtered.merge(yesterday_open_price, on='SYMBOL', how='left')
-    
-    # Calculate continuous gains as percentage
-    continuous_gains = calculate_continuous_gain(df_filtered)
-    
-    # Add continuous gain as a new column
-    df_final_filtered['CONTINUOUS_GAIN'] = df_final_filtered['SYMBOL'].map(continuous_gains)
-    
-    # Add Serial Number column after all filters are applied
-    df_final_filtered = df_final_filtered.reset_index(drop=True)
-    df_final_filtered.insert(0, 'S.No', range(1, len(df_final_filtered) + 1))
+    # Apply Filters and calculate gains, yesterday's open and continuous gains (cached per filter set)
+    with profiling.stage("screener", rows_in=len(df)) as record:
+        df_final_filtered = timed_screener_call(
+            cache_timings, df, engine.screener_version(), yesterday_open_price, days, gain_threshold,
+            security_type, security, symbol_filter, show_fno_only, ticker_symbols, close_price_value
+        )
+        record["rows_out"] = len(df_final_filtered)
+
+    with st.sidebar.expander("Cache"):
+        for label, status, elapsed in cache_timings:
+            st.caption(f"{label}: {status} ({elapsed * 1000:.1f} ms)")
+        stats = engine.screener_cache.stats()
+        st.caption(
+            f"Screener LRU: {stats['entries']}/{stats['max_entries']} tables, {stats['hits']} hits, "
+            f"{stats['misses']} misses, {stats['evictions']} evictions, {stats['invalidations']} invalidations"
+        )
 
     # Display Table with CONTINUOUS_GAIN included
     st.dataframe(df_final_filtered[[
@@ -280,33 +213,65 @@ def run_app():
         'YESTERDAY_OPEN_PRICE', 'GAIN_PERCENT', 'CONTINUOUS_GAIN'
     ]])
 
-    # Plot Bar Chart
-    fig = px.bar(
-        df_final_filtered,
-        x='SECURITY',
-        y='GAIN_PERCENT',
-        title=f"Equities with High Gains over {days} Days",
-        hover_data=['SYMBOL', 'LOW_PRICE', 'CLOSE_PRICE', 'YESTERDAY_OPEN_PRICE', 'CONTINUOUS_GAIN']
+    # Plot Bar Chart (the top bars by gain; the rest are folded into one "Others" bar)
+    with profiling.stage("bar_chart", rows_in=len(df_final_filtered)) as record:
+        df_bars = engine.top_k_bars(df_final_filtered, int(bar_limit))
+        fig = px.bar(
+            df_bars,
+            x='SECURITY',
+            y='GAIN_PERCENT',
+            title=f"Equities with High Gains over {days} Days",
+            hover_data=['SYMBOL', 'LOW_PRICE', 'CLOSE_PRICE', 'YESTERDAY_OPEN_PRICE', 'CONTINUOUS_GAIN', 'STREAK_LENGTH']
+        )
+        st.plotly_chart(fig)
+        payload_bytes = len(fig.to_json())
+        record["rows_out"] = len(df_bars)
+        record["payload_bytes"] = payload_bytes
+    st.caption(
+        f"Bar chart: {min(len(df_final_filtered), int(bar_limit))} of {len(df_final_filtered)} securities, "
+        f"payload {payload_bytes / 1024:.1f} KB"
     )
-    st.plotly_chart(fig)
 
     # Candlestick Chart
-    if not df_filtered.empty and security != "All":
-        df_strike = df_filtered[df_filtered['SECURITY'] == security]
-        if not df_strike.empty:
-            fig_candlestick = go.Figure(data=[go.Candlestick(
-                x=df_strike['DATE'],
-                open=df_strike['OPEN_PRICE'],
-                high=df_strike['HIGH_PRICE'],
-                low=df_strike['LOW_PRICE'],
-                close=df_strike['CLOSE_PRICE']
-            )])
-            st.plotly_chart(fig_candlestick)
-        else:
-            st.warning("No data available for the selected security.")
+    if security != "All":
+        with profiling.stage("candlestick") as record:
+            df_history = load_security_history(engine.data_version(), security)
+            record["rows_in"] = 0 if df_history is None else len(df_history)
+            df_filtered = engine.apply_screener_filters(
+                df_history, security_type, security, symbol_filter, show_fno_only, ticker_symbols, close_price_value
+            )
+            df_strike = df_filtered[df_filtered['SECURITY'] == security]
+            if not df_strike.empty:
+                candles, frequency = engine.resample_candles(df_strike, int(candle_limit))
+                fig_candlestick = go.Figure(data=[go.Candlestick(
+                    x=candles['DATE'],
+                    open=candles['OPEN_PRICE'],
+                    high=candles['HIGH_PRICE'],
+                    low=candles['LOW_PRICE'],
+                    close=candles['CLOSE_PRICE']
+                )])
+                st.plotly_chart(fig_candlestick)
+                payload_bytes = len(fig_candlestick.to_json())
+                record["rows_out"] = len(candles)
+                record["payload_bytes"] = payload_bytes
+                st.caption(
+                    f"Candlestick: {len(candles)} {frequency} candles from {len(df_strike)} trading days, "
+                    f"payload {payload_bytes / 1024:.1f} KB"
+                )
+            else:
+                st.warning("No data available for the selected security.")
     else:
         st.warning("Please select a specific security to view the candlestick chart.")
 
+    # Stage timings of this rerun (and the latest ingestion)
+    if profiling.PROFILING_ENABLED:
+        with st.expander("Performance"):
+            st.dataframe(pd.DataFrame(profiling.current_stages()))
+            last_ingest = profiling.get_runs("process_zip_files", limit=1)
+            if last_ingest:
+                st.caption(f"Last ingestion ({last_ingest[0]['started']}): {last_ingest[0]['seconds']:.2f} s")
+                st.dataframe(pd.DataFrame(last_ingest[0]["stages"]))
+
 # Run the app
 if __name__ == "__main__":
     run_app()
\ No newline at end of file
@@ -0,0 +1,1187 @@
+# engine.py
+# Ingestion, the Parquet price store and the screener engines, without any UI dependency: imported
+# by the Streamlit app (core.py), the API (api.py) and the command line (cli.py).
+import os
+import json
+import hashlib
+import multiprocessing
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pyarrow import fs
+import re
+import shutil
+import zipfile
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+import profiling
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Define directories
+source_folder = "zip"
+output_folder = "output"
+merged_file_path = os.path.join(output_folder, "merged_output.csv")
+fno_file_path = "data/FO_SECURITY.xlsx"  # F&O securities file
+tickers_file_path = "data/tickers.csv"  # New tickers file for SYMBOL matching
+manifest_file_path = os.path.join(output_folder, "ingest_manifest.json")  # Processed ZIP archives
+price_store_folder = os.path.join(output_folder, "price_store")  # Typed Parquet store, one file per trade date
+indicators_file_path = os.path.join(output_folder, "indicators.parquet")  # One row per SECURITY of the screener frame
+security_master_path = os.path.join(output_folder, "security_master.parquet")  # One row per (SYMBOL, SECURITY)
+ingest_lock_path = os.path.join(output_folder, "ingest.lock")  # Locked by the process that is ingesting
+ingest_status_path = os.path.join(output_folder, "ingest_status.json")  # Progress of the latest ingestion job
+STORE_VERSION = 5  # Bump when the layout of the price store changes to force a full rebuild
+PRICE_COLUMNS = ['PREV_CL_PR', 'OPEN_PRICE', 'HIGH_PRICE', 'LOW_PRICE', 'CLOSE_PRICE', 'HI_52_WK', 'LO_52_WK']
+STORE_COLUMNS = ['SECURITY_ID', 'DATE'] + PRICE_COLUMNS  # Store rows carry ids; names live in the security master
+MASTER_COLUMNS = ['SYMBOL', 'SECURITY']  # Store columns that are looked up from the security master by SECURITY_ID
+MERGED_COLUMNS = ['SYMBOL', 'SECURITY', 'PREV_CL_PR', 'OPEN_PRICE', 'HIGH_PRICE', 'LOW_PRICE', 'CLOSE_PRICE', 'DATE']
+INDICATOR_DAYS = 30  # Rolling lows/highs are kept for N = 1..INDICATOR_DAYS
+SCREENER_LOOKBACK_DAYS = INDICATOR_DAYS  # Trading days the screener loads: the largest day range it offers
+CONTINUOUS_GAIN_DAYS = 5  # Rows per instrument key read by the continuous-gain rule
+BAR_CHART_TOP_K = 50  # Bars drawn in the gain chart; the rest are folded into one "Others" bar
+CANDLESTICK_MAX_POINTS = 500  # Candles drawn before the history is resampled to weekly, then monthly
+
+# Expected header of the NSE Pd*.csv (price data) file and the columns we keep from it
+BHAVCOPY_HEADER = [
+    'MKT', 'SERIES', 'SYMBOL', 'SECURITY', 'PREV_CL_PR', 'OPEN_PRICE', 'HIGH_PRICE', 'LOW_PRICE',
+    'CLOSE_PRICE', 'NET_TRDVAL', 'NET_TRDQTY', 'IND_SEC', 'CORP_IND', 'TRADES', 'HI_52_WK', 'LO_52_WK'
+]
+BHAVCOPY_SCHEMA = {
+    'SYMBOL': 'str',
+    'SECURITY': 'str',
+    'PREV_CL_PR': 'float64',
+    'OPEN_PRICE': 'float64',
+    'HIGH_PRICE': 'float64',
+    'LOW_PRICE': 'float64',
+    'CLOSE_PRICE': 'float64',
+    'HI_52_WK': 'float64',
+    'LO_52_WK': 'float64',
+}
+
+# Raised when a Pd*.csv file does not have the expected bhavcopy header
+class BhavcopySchemaError(ValueError):
+    pass
+
+# Function to create the input and output folders (on first use, not at import time)
+def ensure_folders():
+    os.makedirs(source_folder, exist_ok=True)
+    os.makedirs(output_folder, exist_ok=True)
+
+# Function to extract date (from bhav.py)
+def extract_date(folder_name):
+    match = re.search(r"(\d{2})(\d{2})(\d{2})$", folder_name.split(".")[0])
+    if match:
+        day, month, year = match.groups()
+        year = "20" + year if int(year) <= 50 else "19" + year
+        month_names = {
+            "01": "JAN", "02": "FEB", "03": "MAR", "04": "APR", "05": "MAY", "06": "JUN",
+            "07": "JUL", "08": "AUG", "09": "SEP", "10": "OCT", "11": "NOV", "12": "DEC"
+        }
+        month = month_names.get(month, month)
+        return f"{day}-{month}-{year}"
+    return ""
+
+# Function to parse a DD-MON-YYYY trade date once per distinct value (None when it does not parse)
+@lru_cache(maxsize=None)
+def parse_trade_date(formatted_date):
+    try:
+        return datetime.strptime(formatted_date, "%d-%b-%Y")
+    except (TypeError, ValueError):
+        return None
+
+# Function to turn an archive name into a sortable trade date (undated names sort last)
+def trade_date_key(zip_file):
+    return parse_trade_date(extract_date(zip_file)) or datetime.max, zip_file
+
+# Function to read several archives, in parallel worker processes when workers > 1.
+# Results come back in the order of zip_paths whatever the worker scheduling was.
+# on_read(zip_path) is called as each archive finishes (in completion order). Workers are spawned,
+# not forked: the callers (the Streamlit server, the ingestion job thread) run other threads, and a
+# forked child can deadlock on a lock one of them held.
+def read_zip_archives(zip_paths, workers=1, on_read=None):
+    if workers > 1 and len(zip_paths) > 1:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(zip_paths)), mp_context=context) as executor:
+            futures = {executor.submit(read_zip_archive, zip_path): zip_path for zip_path in zip_paths}
+            if on_read is not None:
+                for future in as_completed(futures):
+                    on_read(futures[future])
+            return [future.result() for future in futures]
+    results = []
+    for zip_path in zip_paths:
+        results.append(read_zip_archive(zip_path))
+        if on_read is not None:
+            on_read(zip_path)
+    return results
+
+# Function to lock an open file exclusively (False when blocking=False and another holder has it).
+# The OS drops the lock when the holding process exits, so a crashed run never leaves it stuck.
+def lock_file(f, blocking=True):
+    if fcntl is not None:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            return True
+        except BlockingIOError:
+            return False
+    while True:
+        try:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            time.sleep(0.5)
+
+# Function to release a lock taken with lock_file()
+def unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+# Function to hold the single-writer ingestion lock (output/ingest.lock) across processes: the
+# app, the API, the watcher and the CLI never write the store, the manifest or merged_output.csv
+# at the same time. Blocks until the lock is free, calling on_wait() first if it is taken.
+@contextmanager
+def ingest_lock(on_wait=None):
+    os.makedirs(output_folder, exist_ok=True)
+    with open(ingest_lock_path, "a+") as f:
+        if not lock_file(f, blocking=False):
+            if on_wait is not None:
+                on_wait()
+            lock_file(f)
+        try:
+            yield
+        finally:
+            unlock_file(f)
+
+# Function to check whether some process (or thread) is ingesting right now
+def ingest_locked():
+    if not os.path.exists(ingest_lock_path):
+        return False
+    with open(ingest_lock_path, "a+") as f:
+        if not lock_file(f, blocking=False):
+            return True
+        unlock_file(f)
+        return False
+
+# Function to fingerprint a ZIP archive by size, modification time and content hash
+def file_fingerprint(path, with_hash=True):
+    stat = os.stat(path)
+    fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if with_hash:
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(chunk)
+        fingerprint["sha256"] = sha256.hexdigest()
+    return fingerprint
+
+# Function to load the ingestion manifest (archives already merged into the price store)
+def load_manifest():
+    if os.path.exists(manifest_file_path):
+        with open(manifest_file_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"archives": {}}
+
+# Function to check whether the outputs described by the manifest can be appended to
+def manifest_is_current(manifest, write_csv):
+    if manifest.get("store_version") != STORE_VERSION or not os.path.isdir(price_store_folder):
+        return False
+    if not os.path.exists(security_master_path):
+        return False
+    if write_csv and not (manifest.get("csv_export") and os.path.exists(merged_file_path)):
+        return False
+    return True
+
+# Function to save the ingestion manifest atomically
+def save_manifest(manifest):
+    tmp_path = manifest_file_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_file_path)
+
+# Function to check whether an archive is new or changed since it was last processed
+def archive_changed(zip_path, entry):
+    if entry is None:
+        return True, file_fingerprint(zip_path)
+    quick = file_fingerprint(zip_path, with_hash=False)
+    if quick["size"] != entry.get("size"):
+        return True, file_fingerprint(zip_path)
+    if quick["mtime_ns"] == entry.get("mtime_ns"):
+        return False, entry
+    # Same size but touched: only the content hash can tell
+    fingerprint = file_fingerprint(zip_path)
+    return fingerprint["sha256"] != entry.get("sha256"), fingerprint
+
+# Function to find the Pd*.csv members of a ZIP archive without extracting it
+def find_pd_members(zip_ref):
+    members = []
+    for name in zip_ref.namelist():
+        file = os.path.basename(name)
+        if file.startswith("Pd") and file.endswith(".csv"):
+            members.append(name)
+    return members
+
+# Function to check a Pd*.csv header against the declared bhavcopy layout
+def check_bhavcopy_header(header, source):
+    if header != BHAVCOPY_HEADER:
+        missing = [col for col in BHAVCOPY_HEADER if col not in header]
+        unexpected = [col for col in header if col not in BHAVCOPY_HEADER]
+        raise BhavcopySchemaError(
+            f"Unexpected bhavcopy header in {source}: missing {missing or 'none'}, "
+            f"unexpected {unexpected or 'none'}; got {header}, expected {BHAVCOPY_HEADER}"
+        )
+
+# Function to parse a Pd*.csv stream: only the schema columns, with their declared dtypes.
+# Prices are space padded ("     22124.70") and section rows leave them blank, so leading
+# spaces are skipped and only blank prices become NaN; a blank SYMBOL (index rows) stays "".
+# A row that does not parse (wrong field count, a price that is not a number) fails the archive.
+def read_bhavcopy_csv(f, source):
+    header = [col.strip() for col in f.readline().decode("utf-8-sig").strip().split(",")]
+    check_bhavcopy_header(header, source)
+    try:
+        return pd.read_csv(
+            f,
+            header=None,
+            names=header,
+            usecols=list(BHAVCOPY_SCHEMA),
+            dtype=BHAVCOPY_SCHEMA,
+            engine="c",
+            skipinitialspace=True,
+            keep_default_na=False,
+            na_values={col: [""] for col, dtype in BHAVCOPY_SCHEMA.items() if dtype != 'str'},
+        )
+    except ValueError as e:  # pandas.errors.ParserError and dtype conversion errors
+        raise BhavcopySchemaError(f"Malformed bhavcopy rows in {source}: {e}") from e
+
+# Function to read the Pd*.csv files of one ZIP archive straight from the archive.
+# Nothing is written to disk; the returned stats report what extractall() would have
+# written (every member) against what was actually read (only the Pd members).
+def read_zip_archive(zip_path):
+    formatted_date = extract_date(os.path.basename(zip_path))
+    frames = []
+    start = time.perf_counter()
+
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        pd_members = find_pd_members(zip_ref)
+        for member in pd_members:
+            with zip_ref.open(member) as f:
+                df = read_bhavcopy_csv(f, f"{os.path.basename(zip_path)}/{member}")
+
+            # Add DATE column
+            df["DATE"] = formatted_date
+
+            frames.append(df)
+
+        total_bytes = sum(info.file_size for info in zip_ref.infolist())
+        read_bytes = sum(zip_ref.getinfo(member).file_size for member in pd_members)
+
+    stats = {
+        "read_seconds": round(time.perf_counter() - start, 4),
+        "read_bytes": read_bytes,
+        "extract_bytes_saved": total_bytes,
+        "skipped_bytes": total_bytes - read_bytes,
+    }
+    return frames, stats
+
+# Function to convert merged rows to real types: float64 prices and datetime DATE
+def to_price_frame(df):
+    df = df.copy()
+    for col in PRICE_COLUMNS:
+        if col in df.columns and not pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    if not pd.api.types.is_datetime64_any_dtype(df['DATE']):
+        # Every row of a trading day carries the same date string: parse each distinct one once
+        codes, formatted_dates = pd.factorize(df['DATE'])
+        parsed = pd.DatetimeIndex([parse_trade_date(value) for value in formatted_dates] + [None])
+        df['DATE'] = parsed[codes].to_numpy()
+    return df
+
+# Function to get the store partition file of a trade date
+def partition_path(trade_date):
+    return os.path.join(price_store_folder, f"{pd.Timestamp(trade_date):%Y-%m-%d}.parquet")
+
+# Function to write typed rows into the price store, replacing whole trade-date partitions. Rows are
+# stored by SECURITY_ID (see update_security_master), with real dates and float64 prices. Returns
+# the paths of the partitions written.
+def write_price_store(df, master):
+    os.makedirs(price_store_folder, exist_ok=True)
+    typed = to_price_frame(df).dropna(subset=['DATE'])
+    typed['SECURITY_ID'] = assign_security_ids(typed, master)
+    typed = typed[STORE_COLUMNS]
+    paths = []
+    for trade_date, part in typed.groupby('DATE'):
+        path = partition_path(trade_date)
+        part.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+        paths.append(path)
+    return paths
+
+# Function to delete the partitions of the price store that a full rebuild did not write (trade
+# dates whose archives left zip/). Runs after the rebuild, so readers never see an empty store.
+def prune_price_store(keep):
+    keep = {os.path.basename(path) for path in keep}
+    for file in os.listdir(price_store_folder):
+        if file.endswith(".parquet") and file not in keep:
+            os.remove(os.path.join(price_store_folder, file))
+
+# Function to list store partitions, optionally restricted to a [start, end] trade-date range
+def list_partitions(start=None, end=None, last=None):
+    if not os.path.isdir(price_store_folder):
+        return []
+    paths = []
+    for file in sorted(os.listdir(price_store_folder)):
+        if not file.endswith(".parquet"):
+            continue
+        trade_date = pd.Timestamp(file[:-len(".parquet")])
+        if start is not None and trade_date < pd.Timestamp(start):
+            continue
+        if end is not None and trade_date > pd.Timestamp(end):
+            continue
+        paths.append(os.path.join(price_store_folder, file))
+    return paths[-last:] if last else paths
+
+# Function to load typed rows from the price store (memory-mapped, only the requested columns/dates).
+# `last` keeps only the latest N trading-date partitions; `security` (or a list of SECURITY_IDs,
+# `ids`) is pushed down as a row filter. SYMBOL and SECURITY are looked up from the security master
+# by SECURITY_ID.
+def load_price_store(columns=None, start=None, end=None, last=None, security=None, ids=None):
+    paths = list_partitions(start, end, last)
+    if not paths:
+        return None
+    dataset = ds.dataset(paths, format="parquet", filesystem=fs.LocalFileSystem(use_mmap=True))
+    master = load_security_master()
+    if master is None:
+        # A store written before the security master existed still has the names in its rows
+        row_filter = ds.field('SECURITY') == security if security is not None else None
+        return dataset.to_table(columns=columns, filter=row_filter).to_pandas()
+
+    columns = list(columns) if columns is not None else MASTER_COLUMNS + STORE_COLUMNS
+    physical = [col for col in columns if col not in MASTER_COLUMNS]
+    if len(physical) < len(columns) and 'SECURITY_ID' not in physical:
+        physical.append('SECURITY_ID')
+    if security is not None:
+        security_ids = master.loc[master['SECURITY'] == security, 'SECURITY_ID'].to_numpy()
+        ids = security_ids if ids is None else np.intersect1d(ids, security_ids)
+    row_filter = ds.field('SECURITY_ID').isin(pa.array(np.asarray(ids, dtype=np.int32))) if ids is not None else None
+    df = dataset.to_table(columns=physical, filter=row_filter).to_pandas()
+    ids = df['SECURITY_ID'].to_numpy() if 'SECURITY_ID' in df.columns else None
+    for col in columns:
+        if col in MASTER_COLUMNS:
+            df[col] = pd.Series(master[col].to_numpy()[ids], index=df.index, dtype='str')
+    return df[columns]
+
+# Function to load price data: the typed store when present, otherwise the merged CSV. ids (store
+# only) limits the read to those SECURITY_IDs; the merged CSV is read whole.
+def load_price_data(columns=None, start=None, end=None, last=None, security=None, ids=None):
+    df = load_price_store(columns, start, end, last, security, ids)
+    if df is None and os.path.exists(merged_file_path):
+        df = to_price_frame(pd.read_csv(merged_file_path, dtype={'SYMBOL': 'str', 'SECURITY': 'str'}, keep_default_na=False))
+        if start is not None:
+            df = df[df['DATE'] >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df['DATE'] <= pd.Timestamp(end)]
+        if last:
+            df = df[df['DATE'].isin(np.sort(df['DATE'].dropna().unique())[-last:])]
+        if security is not None:
+            df = df[df['SECURITY'] == security]
+        if columns is not None:
+            df = df[columns]
+    return df
+
+# Function to normalize SYMBOL values the way every stage compares them
+def normalize_symbol(symbols):
+    return symbols.astype(str).str.upper().str.strip()
+
+# Function to take the upper-cased first word of security names (the F&O matching key)
+def first_word(names):
+    return names.str.split().str[0].str.upper().str.strip()
+
+# Function to classify security names: "Nifty" indices, "2.5%" bonds or "Others"
+def security_class(names):
+    return np.select(
+        [names.str.startswith("Nifty", na=False), names.str.startswith("2.5", na=False)], ["Nifty", "2.5%"], "Others"
+    )
+
+# Function to get the distinct (normalized SYMBOL, SECURITY) pairs of price rows
+def security_pairs(df):
+    pairs = pd.DataFrame({'SYMBOL': normalize_symbol(df['SYMBOL']), 'SECURITY': df['SECURITY']})
+    return pairs[~pair_index(pairs).duplicated()].reset_index(drop=True)
+
+# Function to build security master rows for (SYMBOL, SECURITY) pairs, numbered from start_id: the
+# instrument KEY, FIRST_WORD and SECURITY_CLASS. The F&O and tickers.csv memberships are not stored:
+# data/ changes independently of ingestion, so they are worked out per SECURITY_ID when screening
+# (see load_screener_frame).
+def build_security_master(pairs, start_id=0):
+    master = pd.DataFrame({
+        'SECURITY_ID': np.arange(start_id, start_id + len(pairs), dtype=np.int32),
+        'SYMBOL': pairs['SYMBOL'].to_numpy(),
+        'SECURITY': pairs['SECURITY'].to_numpy(),
+    })
+    master['KEY'] = instrument_key(master)
+    master['FIRST_WORD'] = first_word(master['SECURITY']).fillna('')
+    master['SECURITY_CLASS'] = security_class(master['SECURITY'])
+    return master
+
+# Function to index rows by their normalized (SYMBOL, SECURITY) pair (missing names compare equal)
+def pair_index(df):
+    return pd.MultiIndex.from_arrays([normalize_symbol(df['SYMBOL']).fillna(''), df['SECURITY'].fillna('')])
+
+# Function to look up the SECURITY_ID of every price row (-1 when the pair is not in the master)
+def assign_security_ids(df, master):
+    positions = pair_index(master).get_indexer(pair_index(df))
+    return np.where(positions >= 0, master['SECURITY_ID'].to_numpy()[positions], -1).astype(np.int32)
+
+# Function to read the security master once per file version. The cached frame is shared, so
+# callers must not modify it in place.
+@lru_cache(maxsize=1)
+def read_security_master(version):
+    return pd.read_parquet(security_master_path) if version is not None else None
+
+# Function to load the security master (None before the first ingest). Rows are ordered by
+# SECURITY_ID, which runs from 0 without gaps, so an id is also its row position.
+def load_security_master():
+    return read_security_master(file_version(security_master_path))
+
+# Function to get the earliest trade date of the rows of each master security in df (NaT for
+# securities without dated rows in df)
+def first_trade_dates(df, master):
+    ids = assign_security_ids(df, master)
+    codes, formatted_dates = pd.factorize(df['DATE'])
+    never = np.datetime64(datetime.max, 'D')
+    days = np.array([parse_trade_date(value) or datetime.max for value in formatted_dates] + [datetime.max], dtype='datetime64[D]')
+    first = np.full(len(master), never)
+    np.minimum.at(first, ids[ids >= 0], days[codes][ids >= 0])
+    return pd.Series(np.where(first == never, np.datetime64('NaT'), first).astype('datetime64[ns]'), index=master.index)
+
+# Function to add the securities first seen in new_df to the persisted security master and refresh
+# FIRST_DATE, the earliest trade date ingested for each security. Ids of known securities never
+# change, not even on a rebuild: the master is written before the partitions, so a reader of the
+# old partitions still resolves every id it finds.
+def update_security_master(new_df, rebuild=False):
+    master = load_security_master()
+    if master is not None and rebuild:
+        # Recompute the derived columns (and FIRST_DATE) of the known securities under their ids
+        master = build_security_master(master)
+    pairs = security_pairs(new_df)
+    if master is not None:
+        pairs = pairs[pair_index(master).get_indexer(pair_index(pairs)) < 0]
+    start_id = 0 if master is None else len(master)
+    added = build_security_master(pairs, start_id)
+    master = added if master is None else pd.concat([master, added], ignore_index=True)
+    first_dates = first_trade_dates(new_df, master)
+    if 'FIRST_DATE' in master.columns:
+        first_dates = pd.concat([master['FIRST_DATE'], first_dates], axis=1).min(axis=1)
+    master['FIRST_DATE'] = first_dates
+    write_parquet_atomic(master, security_master_path)
+    return master
+
+# Function to sort merged rows by trade date (undated rows last), keeping the order of the rows of a day
+def sort_by_trade_date(df):
+    codes, formatted_dates = pd.factorize(df['DATE'])
+    keys = np.array([parse_trade_date(value) or datetime.max for value in formatted_dates] + [datetime.max], dtype='datetime64[us]')
+    return df.iloc[np.argsort(keys[codes], kind='stable')]
+
+# Function to export newly ingested rows to merged_output.csv (the original column layout), in
+# trade-date order. Rows of days after the last exported day are appended; a backfilled day
+# (in_order=False) or a re-ingested one (replace_dates) makes the file be rewritten in date order.
+# The new file is written next to the old one and swapped in, so readers never see a partial file.
+def export_merged_csv(new_df, rebuild=False, replace_dates=(), in_order=True):
+    new_df = new_df[MERGED_COLUMNS]
+    tmp_path = merged_file_path + ".tmp"
+    if rebuild:
+        new_df.to_csv(tmp_path, index=False)
+    elif replace_dates or not in_order:
+        # Drop the old rows of re-ingested days so nothing is duplicated
+        existing_df = pd.read_csv(merged_file_path, dtype=str, keep_default_na=False)
+        existing_df = existing_df[~existing_df["DATE"].isin(replace_dates)]
+        final_df = pd.concat([existing_df, new_df.reindex(columns=existing_df.columns)], ignore_index=True)
+        sort_by_trade_date(final_df).to_csv(tmp_path, index=False)
+    else:
+        header = pd.read_csv(merged_file_path, nrows=0).columns
+        shutil.copyfile(merged_file_path, tmp_path)
+        new_df.reindex(columns=header).to_csv(tmp_path, mode="a", header=False, index=False)
+    os.replace(tmp_path, merged_file_path)
+
+# Function to process ZIP files (bhav.py logic)
+# With incremental=True only archives that are new or changed since the last run (per the
+# ingestion manifest) are parsed; their rows replace any existing rows for the same DATE.
+# Archives are parsed by up to `workers` processes and merged in trade-date order.
+# Rows always land in the typed price store; write_csv also keeps merged_output.csv as an export.
+# zip_names limits the run to those archives of zip/ (the watcher passes the ones that finished writing).
+# Runs hold ingest_lock(), so concurrent calls from any process are serialized. progress(step, done,
+# total, archive) is called as the run advances: "waiting" while another run holds the lock, "read"
+# after each archive, then once per write stage.
+@profiling.profiled("process_zip_files")
+def process_zip_files(incremental=True, workers=1, write_csv=True, zip_names=None, progress=None):
+    ensure_folders()
+    with ingest_lock(on_wait=lambda: report_progress(progress, "waiting")):
+        return merge_zip_files(incremental, workers, write_csv, zip_names, progress)
+
+# Function to call a progress callback of process_zip_files(), if there is one
+def report_progress(progress, step, done=0, total=0, archive=None):
+    if progress is not None:
+        progress(step, done, total, archive)
+
+# Function to merge new or changed archives into the store (process_zip_files() with the lock held)
+def merge_zip_files(incremental, workers, write_csv, zip_names, progress):
+    zip_files = sorted((f for f in os.listdir(source_folder) if f.endswith(".zip")), key=trade_date_key)
+    if zip_names is not None:
+        zip_files = [zip_file for zip_file in zip_files if zip_file in set(zip_names)]
+    manifest = load_manifest()
+    if not incremental or not manifest_is_current(manifest, write_csv):
+        manifest = {"archives": {}}
+    archives = manifest["archives"]
+
+    pending = []
+    touched = False
+    with profiling.stage("scan_archives", rows_in=len(zip_files)) as record:
+        for zip_file in zip_files:
+            entry = archives.get(zip_file)
+            changed, fingerprint = archive_changed(os.path.join(source_folder, zip_file), entry)
+            if changed:
+                pending.append((zip_file, fingerprint))
+            elif fingerprint is not entry:
+                # Content unchanged, only the timestamp moved: remember it to skip hashing next time
+                entry.update(fingerprint)
+                touched = True
+        record["rows_out"] = len(pending)
+
+    if not pending:
+        if touched:
+            save_manifest(manifest)
+        if archives:
+            return True, f"✅ No new ZIP files. Price store is up to date at: {price_store_folder}", None
+        return False, "No valid CSV files found for processing.", None
+
+    merged_data = []
+    processed = {}
+    read_count = [0]
+    report_progress(progress, "read", 0, len(pending))
+
+    def on_read(zip_path):
+        read_count[0] += 1
+        report_progress(progress, "read", read_count[0], len(pending), os.path.basename(zip_path))
+
+    try:
+        with profiling.stage("read_archives", rows_in=len(pending)) as record:
+            results = read_zip_archives([os.path.join(source_folder, zip_file) for zip_file, _ in pending], workers, on_read)
+            record["rows_out"] = sum(len(df) for frames, _ in results for df in frames)
+    except BhavcopySchemaError as e:
+        return False, f"❌ {e}", None
+    for (zip_file, fingerprint), (frames, stats) in zip(pending, results):
+        merged_data.extend(frames)
+        processed[zip_file] = dict(
+            fingerprint,
+            **stats,
+            date=extract_date(zip_file),
+            rows=sum(len(df) for df in frames),
+            processed_at=datetime.now().isoformat(timespec="seconds"),
+        )
+
+    if not merged_data:
+        return False, "No valid CSV files found for processing.", None
+
+    new_df = pd.concat(merged_data, ignore_index=True)
+    new_dates = {entry["date"] for entry in processed.values()}
+    known_dates = {entry.get("date") for entry in archives.values()}
+
+    report_progress(progress, "write_price_store", len(pending), len(pending))
+    with profiling.stage("update_security_master", rows_in=len(new_df)) as record:
+        master = update_security_master(new_df, rebuild=not archives)
+        record["rows_out"] = len(master)
+    with profiling.stage("write_price_store", rows_in=len(new_df)):
+        # A full rebuild replaces the partitions in place: each one swaps atomically and the master
+        # keeps every id, so readers see old or new partitions, never a missing store
+        written = write_price_store(new_df, master)
+        if not archives:
+            prune_price_store(written)
+    report_progress(progress, "update_indicators", len(pending), len(pending))
+    with profiling.stage("update_indicators", rows_in=len(new_df)):
+        update_indicators()
+
+    if write_csv:
+        report_progress(progress, "export_csv", len(pending), len(pending))
+        with profiling.stage("export_csv", rows_in=len(new_df)):
+            reingested = new_dates & known_dates or any(zip_file in archives for zip_file in processed)
+            known_days = [parse_trade_date(date) for date in known_dates]
+            new_days = [parse_trade_date(date) or datetime.max for date in new_dates]
+            in_order = min(new_days) > max((day for day in known_days if day is not None), default=datetime.min)
+            export_merged_csv(
+                new_df, rebuild=not archives, replace_dates=new_dates if reingested else set(), in_order=in_order
+            )
+
+    archives.update(processed)
+    manifest["store_version"] = STORE_VERSION
+    manifest["csv_export"] = write_csv
+    save_manifest(manifest)
+    saved_mb = sum(entry["extract_bytes_saved"] for entry in processed.values()) / (1024 * 1024)
+    read_seconds = sum(entry["read_seconds"] for entry in processed.values())
+    return True, (
+        f"✅ Merged {len(processed)} ZIP file(s) ({len(new_df)} rows) into: {price_store_folder} "
+        f"— read in {read_seconds:.2f}s, {saved_mb:.1f} MB of extraction to disk avoided"
+    ), new_df
+
+# Function to get the row positions that sort df by a group column and then DATE (stable, like
+# sort_values on both columns), leaving out rows with a missing group value or outside `mask`.
+# Returns the positions, the group code of each sorted row and the group values by code.
+def group_order(groups, dates, mask=None):
+    codes, uniques = pd.factorize(groups, sort=True)
+    if mask is not None:
+        codes = np.where(mask, codes, -1)
+    order = np.lexsort((dates.to_numpy(), codes))
+    order = order[codes[order] >= 0]
+    return order, codes[order], np.asarray(uniques, dtype=object)
+
+# Function to widen prices to float64. float32 prices (the compact screener frame) are rounded back
+# to 4 decimals below 512, where float32 is within 3e-5 (India VIX is quoted to 4 decimals), and to
+# 2 decimals from 512 up. compact_price_frame() only narrows columns for which that gives the
+# original prices back.
+def widen_prices(values):
+    if values.dtype == np.float32:
+        wide = values.astype(np.float64)
+        return np.where(np.abs(wide) < 512, np.round(wide, 4), np.round(wide, 2))
+    return values
+
+# Function to calculate day-wise gain per SECURITY for one or several day ranges in one pass.
+# The anchor is the LOW_PRICE `days` rows back from the latest row (the first row when there is
+# less history) and the gain runs to the latest CLOSE_PRICE. Pass a list of day ranges to get a
+# dict of {days: frame} computed from a single sort. `mask` limits the rows used without copying df.
+def calculate_daywise_gain(df, days, mask=None):
+    columns = ['SECURITY', 'SYMBOL', 'LOW_PRICE', 'CLOSE_PRICE', 'GAIN_PERCENT']
+    multiple = isinstance(days, (list, tuple, set))
+    days_list = list(days) if multiple else [days]
+
+    order, codes, securities = group_order(df['SECURITY'], df['DATE'], mask)
+    if len(order) == 0:
+        results = {n: pd.DataFrame(columns=columns) for n in days_list}
+        return results if multiple else results[days]
+
+    # Group boundaries of the sorted rows: order[starts[i]:ends[i]] holds one security
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], len(codes)]
+    lows = df['LOW_PRICE'].to_numpy()
+    latest_close = widen_prices(df['CLOSE_PRICE'].to_numpy()[order[ends - 1]])
+    latest_symbol = np.asarray(df['SYMBOL'].to_numpy()[order[ends - 1]], dtype=object)
+
+    results = {}
+    for n in days_list:
+        low_price = widen_prices(lows[order[np.maximum(starts, ends - n)]])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            gain_percent = np.where(low_price != 0, ((latest_close - low_price) / low_price) * 100, 0)
+        results[n] = pd.DataFrame({
+            'SECURITY': securities[codes[starts]],
+            'SYMBOL': latest_symbol,
+            'LOW_PRICE': low_price,
+            'CLOSE_PRICE': latest_close,
+            'GAIN_PERCENT': gain_percent,
+        }, columns=columns)
+    return results if multiple else results[days]
+
+# Function to compile the F&O first words into a single regex; a FIRST_WORD is an F&O security
+# when any of the words occurs inside it
+@lru_cache(maxsize=8)
+def build_fno_matcher(fno_words):
+    words = sorted({word for word in fno_words if isinstance(word, str)}, key=len, reverse=True)
+    return re.compile("|".join(map(re.escape, words))) if words else None
+
+# Function to flag the first words (a FIRST_WORD column) that partially match an F&O first word.
+# Each distinct first word is matched once and the result is mapped back through its factorized code.
+def fno_word_flags(first_words, fno_list):
+    matcher = build_fno_matcher(tuple(fno_list))
+    if matcher is None:
+        return np.zeros(len(first_words), dtype=bool)
+    codes, words = pd.factorize(first_words)
+    is_fno = np.fromiter((matcher.search(word) is not None for word in words), dtype=bool, count=len(words))
+    return np.append(is_fno, False)[codes]
+
+# Function to filter by first-word with partial matching
+def filter_first_word_partial(df, fno_list):
+    if not fno_list:
+        return df
+    return df[fno_word_flags(df['FIRST_WORD'], fno_list)]
+
+# Function to get the row mask of a security type: "Nifty" indices, "2.5%" bonds, "Others" or
+# "NONE" (None: no filter). The compact frame carries SECURITY_CLASS from the security master, so
+# this compares integer codes; other frames classify their SECURITY names.
+def security_type_mask(df, security_type):
+    if security_type not in ("Nifty", "2.5%", "Others"):
+        return None
+    classes = df['SECURITY_CLASS'] if 'SECURITY_CLASS' in df.columns else pd.Series(security_class(df['SECURITY']), index=df.index)
+    return (classes == security_type).to_numpy(dtype=bool)
+
+# Function to filter by security type: "Nifty" indices, "2.5%" bonds, "Others" or "NONE" (no filter)
+def filter_security_type(df, security_type):
+    mask = security_type_mask(df, security_type)
+    return df if mask is None else df[mask]
+
+# Function to build the key that identifies one instrument: its SYMBOL, or its SECURITY name for
+# index rows, which have a blank SYMBOL and would otherwise all collapse into one group
+def instrument_key(df):
+    if 'KEY' in df.columns:
+        return df['KEY']
+    symbol = df['SYMBOL'].fillna('').astype(str).str.strip()
+    return symbol.where(symbol != '', df['SECURITY'])
+
+# Function to calculate continuous green candles percentage gain from lowest point.
+# Over the last `days` rows of each instrument the streak starts at the first candle whose close
+# is not above the previous close (or at the first row when every close rose); the gain runs from
+# the lowest OPEN_PRICE of the streak to the latest close. Returns one row per instrument_key()
+# with CONTINUOUS_GAIN (rounded to 2 decimals, 0.0 when there is no streak), STREAK_LENGTH (the
+# number of consecutive closes above the previous close that end at the latest row, within the
+# window) and ANCHOR_PRICE. `mask` limits the rows used without copying df.
+def calculate_continuous_gain(df, days=CONTINUOUS_GAIN_DAYS, mask=None):
+    columns = ['CONTINUOUS_GAIN', 'STREAK_LENGTH', 'ANCHOR_PRICE']
+    order, codes, key_values = group_order(instrument_key(df), df['DATE'], mask)
+
+    # Keep the last `days` rows of every instrument
+    group_end = np.r_[np.flatnonzero(codes[1:] != codes[:-1]) + 1, len(codes)]
+    rows_left = np.repeat(group_end, np.diff(np.r_[0, group_end])) - np.arange(len(codes))
+    window = order[rows_left <= days]
+    keys = codes[rows_left <= days]
+    if len(keys) == 0:
+        return pd.DataFrame(columns=columns, index=pd.Index([], name='KEY'))
+
+    new_group = np.r_[True, keys[1:] != keys[:-1]]
+    group_id = np.cumsum(new_group) - 1
+    starts = np.flatnonzero(new_group)
+    sizes = np.diff(np.r_[starts, len(keys)])
+    position = np.arange(len(keys)) - starts[group_id]
+
+    # First candle (position >= 1) whose close does not beat the previous close
+    closes = df['CLOSE_PRICE'].to_numpy()[window]
+    breaks = np.r_[False, closes[1:] <= closes[:-1]] & (position >= 1)
+    first_break = np.full(len(starts), np.iinfo(np.int64).max)
+    np.minimum.at(first_break, group_id[breaks], position[breaks])
+    has_break = first_break < sizes
+    streak_start = np.where(has_break, first_break, 0)
+
+    # Lowest OPEN_PRICE from the start of the streak to the latest row
+    lows = np.where(position >= streak_start[group_id], widen_prices(df['OPEN_PRICE'].to_numpy()[window]), np.inf)
+    lowest_price = np.full(len(starts), np.inf)
+    np.minimum.at(lowest_price, group_id, lows)
+    latest_close = widen_prices(closes[starts + sizes - 1])
+
+    # Trailing run of closes above the previous close, ending at the latest row
+    rising = np.r_[False, closes[1:] > closes[:-1]] & (position >= 1)
+    last_reset = np.maximum.accumulate(np.where(rising, 0, np.arange(len(keys))))
+    latest = starts + sizes - 1
+    streak_length = latest - last_reset[latest]
+
+    has_streak = (sizes >= 2) & (~has_break | (streak_start < sizes - 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gain_percent = np.where(lowest_price != 0, ((latest_close - lowest_price) / lowest_price) * 100, 0.0)
+    return pd.DataFrame({
+        'CONTINUOUS_GAIN': np.where(has_streak, np.round(gain_percent, 2), 0.0),
+        'STREAK_LENGTH': streak_length,
+        'ANCHOR_PRICE': np.where(has_streak, lowest_price, np.nan),
+    }, index=pd.Index(key_values[keys[starts]], name='KEY'), columns=columns)
+
+# Function to clean and prepare typed price rows for the screener
+def clean_price_frame(df):
+    df = df.dropna(subset=['LOW_PRICE', 'HIGH_PRICE', 'CLOSE_PRICE', 'OPEN_PRICE', 'DATE', 'SYMBOL'])
+    df['SYMBOL'] = normalize_symbol(df['SYMBOL'])
+    return df
+
+# Function to build the indicator table of a screener frame (see load_screener_frame): one row per
+# SECURITY, in the order of calculate_daywise_gain(). For N = 1..INDICATOR_DAYS it holds the rolling
+# N-row LOW_N/HIGH_N, and ANCHOR_LOW_N, the LOW_PRICE N rows back (the first row when there is less
+# history) that the day-wise gain starts from. Also: the latest and previous open and close, the
+# trailing run of rising closes within the loaded rows, the distance to the 52-week high and low,
+# and the continuous gain of the instrument key. hi_52_wk and lo_52_wk are aligned with the rows of df.
+def compute_indicators(df, hi_52_wk, lo_52_wk):
+    order, codes, securities = group_order(df['SECURITY'], df['DATE'])
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], len(codes)]
+    rows = ends - starts
+    group_id = np.repeat(np.arange(len(starts)), rows)
+    rows_left = np.repeat(ends, rows) - np.arange(len(order))  # 1 at the latest row of a security
+    closes = widen_prices(df['CLOSE_PRICE'].to_numpy()[order])
+
+    # Right-aligned (securities x INDICATOR_DAYS) matrices, latest row in the last column
+    recent = rows_left <= INDICATOR_DAYS
+    column = INDICATOR_DAYS - rows_left[recent]
+
+    def recent_matrix(values):
+        matrix = np.full((len(starts), INDICATOR_DAYS), np.nan)
+        matrix[group_id[recent], column] = values[recent]
+        return matrix
+
+    lows = recent_matrix(widen_prices(df['LOW_PRICE'].to_numpy()[order]))
+    rolling_lows = np.fmin.accumulate(lows[:, ::-1], axis=1)
+    rolling_highs = np.fmax.accumulate(recent_matrix(widen_prices(df['HIGH_PRICE'].to_numpy()[order]))[:, ::-1], axis=1)
+    sessions = np.minimum(rows, INDICATOR_DAYS)
+
+    last = order[ends - 1]
+    previous = order[np.maximum(starts, ends - 2)]
+    rising = np.r_[False, closes[1:] > closes[:-1]] & (rows_left < np.repeat(rows, rows))
+    last_reset = np.maximum.accumulate(np.where(rising, 0, np.arange(len(order))))
+    continuous = calculate_continuous_gain(df)
+
+    table = pd.DataFrame({
+        'SECURITY': pd.Series(securities[codes[starts]], dtype='str'),
+        'SYMBOL': pd.Series(np.asarray(df['SYMBOL'].to_numpy()[last], dtype=object), dtype='str'),
+        'LAST_DATE': from_date_key(df['DATE'].to_numpy()[last]).to_numpy(),
+        'SESSIONS': sessions,
+        'LAST_OPEN_PRICE': widen_prices(df['OPEN_PRICE'].to_numpy()[last]),
+        'LAST_CLOSE_PRICE': closes[ends - 1],
+        'PREV_OPEN_PRICE': np.where(rows >= 2, widen_prices(df['OPEN_PRICE'].to_numpy()[previous]), np.nan),
+        'PREV_CLOSE_PRICE': np.where(rows >= 2, closes[np.maximum(starts, ends - 2)], np.nan),
+        'RISING_STREAK': (ends - 1) - last_reset[ends - 1],
+        'HI_52_WK': np.asarray(hi_52_wk, dtype=np.float64)[last],
+        'LO_52_WK': np.asarray(lo_52_wk, dtype=np.float64)[last],
+    })
+    table['SECURITY_CLASS'] = security_class(table['SECURITY'])
+    table['KEY'] = instrument_key(table[['SYMBOL', 'SECURITY']])
+    table['CONTINUOUS_GAIN'] = table['KEY'].map(continuous['CONTINUOUS_GAIN']).to_numpy()
+    table['STREAK_LENGTH'] = table['KEY'].map(continuous['STREAK_LENGTH']).to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        table['PCT_FROM_52W_HIGH'] = np.where(table['HI_52_WK'] > 0, (table['LAST_CLOSE_PRICE'] / table['HI_52_WK'] - 1) * 100, np.nan)
+        table['PCT_FROM_52W_LOW'] = np.where(table['LO_52_WK'] > 0, (table['LAST_CLOSE_PRICE'] / table['LO_52_WK'] - 1) * 100, np.nan)
+    per_day = {}
+    for n in range(1, INDICATOR_DAYS + 1):
+        per_day[f'LOW_{n}'] = rolling_lows[:, n - 1]
+        per_day[f'HIGH_{n}'] = rolling_highs[:, n - 1]
+        per_day[f'ANCHOR_LOW_{n}'] = lows[np.arange(len(starts)), INDICATOR_DAYS - np.minimum(n, sessions)]
+    return pd.concat([table, pd.DataFrame(per_day)], axis=1)
+
+# Function to write a frame to Parquet atomically
+def write_parquet_atomic(df, path):
+    df.to_parquet(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+
+# Function to rebuild the indicator table from the price store after an ingest. It reads the
+# screener frame (the lookback window, extended where a security needs older rows), so the cost
+# stays flat as history grows, and a backfilled day is picked up like any other.
+def update_indicators():
+    df = load_screener_frame(extra_columns=['HI_52_WK', 'LO_52_WK'])
+    if df is None or not len(df):
+        return
+    write_parquet_atomic(compute_indicators(df, df['HI_52_WK'], df['LO_52_WK']), indicators_file_path)
+
+# Function to calculate the most recent OPEN_PRICE for each SYMBOL
+def latest_open_prices(df):
+    order, codes, symbols = group_order(df['SYMBOL'], df['DATE'])
+    last = np.r_[np.flatnonzero(codes[1:] != codes[:-1]), len(codes) - 1] if len(codes) else np.array([], dtype=int)
+    return pd.DataFrame({
+        'SYMBOL': pd.Series(symbols[codes[last]], dtype='str'),
+        'YESTERDAY_OPEN_PRICE': widen_prices(df['OPEN_PRICE'].to_numpy()[order[last]]),
+    })
+
+# Function to build the row mask of the screener filters (the sidebar filters of run_app), so the
+# engines can skip rows without copying the price frame. None means every row passes.
+def screener_mask(df, security_type="NONE", security="All", symbol="All", fno_only=False,
+                  ticker_symbols=None, close_min=None):
+    masks = [security_type_mask(df, security_type)]
+
+    if security != "All":
+        masks.append((df['SECURITY'] == security).to_numpy(dtype=bool))
+
+    if symbol != "All":
+        masks.append((df['SYMBOL'] == symbol).to_numpy(dtype=bool))
+
+    if fno_only and ticker_symbols:
+        masks.append(df['SYMBOL'].isin(ticker_symbols).to_numpy(dtype=bool))
+
+    if close_min is not None:
+        masks.append(df['CLOSE_PRICE'].to_numpy() >= close_min)
+
+    masks = [mask for mask in masks if mask is not None]
+    return np.logical_and.reduce(masks) if masks else None
+
+# Function to apply the screener filters (the sidebar filters of run_app) to the price frame
+def apply_screener_filters(df, security_type="NONE", security="All", symbol="All", fno_only=False,
+                           ticker_symbols=None, close_min=None):
+    mask = screener_mask(df, security_type, security, symbol, fno_only, ticker_symbols, close_min)
+    return df if mask is None else df[mask]
+
+# Function to build the gain screener table from filtered rows: day-wise gain over `days`, at or
+# above gain_threshold, with yesterday's open, the continuous gain and a serial number. Pass the
+# unfiltered frame with a screener_mask() to avoid copying the filtered rows.
+def run_screener(df_filtered, days, gain_threshold, yesterday_open_price, mask=None):
+    # Calculate gains based on filtered data
+    df_daywise = calculate_daywise_gain(df_filtered, days, mask)
+    df_final_filtered = df_daywise[df_daywise['GAIN_PERCENT'] >= gain_threshold]
+
+    # Merge with yesterday_open_price
+    df_final_filtered = df_final_filtered.merge(yesterday_open_price, on='SYMBOL', how='left')
+
+    # Calculate continuous gains as percentage
+    continuous_gains = calculate_continuous_gain(df_filtered, mask=mask)
+
+    # Add continuous gain as a new column
+    final_keys = instrument_key(df_final_filtered)
+    df_final_filtered['CONTINUOUS_GAIN'] = final_keys.map(continuous_gains['CONTINUOUS_GAIN'])
+    df_final_filtered['STREAK_LENGTH'] = final_keys.map(continuous_gains['STREAK_LENGTH'])
+
+    # Add Serial Number column after all filters are applied
+    df_final_filtered = df_final_filtered.reset_index(drop=True)
+    df_final_filtered.insert(0, 'S.No', range(1, len(df_final_filtered) + 1))
+    return df_final_filtered
+
+# Bounded LRU cache of final screener tables, keyed by the dataset version and the normalized
+# filter parameters. A new dataset version (an ingest, or a new F&O / tickers file) drops every
+# cached table. Cached tables are shared, so callers must not modify them in place.
+class ScreenerCache:
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.version = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_or_compute(self, version, params, compute):
+        with self.lock:
+            if version != self.version:
+                if self.entries:
+                    self.invalidations += 1
+                    self.entries.clear()
+                self.version = version
+            if params in self.entries:
+                self.entries.move_to_end(params)
+                self.hits += 1
+                return self.entries[params]
+            self.misses += 1
+
+        result = compute()
+
+        with self.lock:
+            if version == self.version:
+                self.entries[params] = result
+                self.entries.move_to_end(params)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+        return result
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+screener_cache = ScreenerCache()
+
+# Function to get the version of everything a screener result depends on
+def screener_version():
+    return data_version(), file_version(fno_file_path), file_version(tickers_file_path)
+
+# Function to get the screener table for a set of filters, from screener_cache when the same
+# normalized filters were already computed for this dataset version
+def cached_screener(df, version, yesterday_open_price, days, gain_threshold, security_type="NONE",
+                    security="All", symbol="All", fno_only=False, ticker_symbols=None, close_min=None):
+    params = (
+        int(days), float(gain_threshold), security_type, security, symbol,
+        bool(fno_only and ticker_symbols), None if close_min is None else float(close_min),
+    )
+
+    def compute():
+        mask = screener_mask(df, security_type, security, symbol, fno_only, ticker_symbols, close_min)
+        return run_screener(df, days, gain_threshold, yesterday_open_price, mask)
+
+    return screener_cache.get_or_compute(version, params, compute)
+
+# Function to turn a datetime column into int32 yyyymmdd date keys
+def to_date_key(dates):
+    return (dates.dt.year * 10000 + dates.dt.month * 100 + dates.dt.day).astype(np.int32)
+
+# Function to turn int32 yyyymmdd date keys back into datetimes (for charts and labels)
+def from_date_key(keys):
+    return pd.to_datetime(pd.Series(keys).astype(str), format='%Y%m%d')
+
+# Function to build the compact screener frame from cleaned price rows: SYMBOL, SECURITY, the
+# derived FIRST_WORD, the instrument KEY and SECURITY_CLASS as categoricals (one small integer code
+# per row), prices as float32 and DATE as an int32 yyyymmdd key, which sorts and compares like the
+# date itself. A price column that does not round-trip through float32 and widen_prices() (prices
+# from 131072 up, or more than 2 decimals from 512 up) stays float64. About 29 bytes per row against
+# ~175 for the string/float64 frame (see README.md).
+# Rows with a SECURITY_ID take their categories straight from the security master; rows with names
+# (the merged-CSV fallback) get an ad-hoc master first.
+def compact_price_frame(df, master=None):
+    if master is None or 'SECURITY_ID' not in df.columns:
+        master = build_security_master(security_pairs(df))
+        ids = assign_security_ids(df, master)
+    else:
+        ids = df['SECURITY_ID'].to_numpy()
+    compact = {}
+    for col in ['SYMBOL', 'SECURITY', 'FIRST_WORD', 'KEY', 'SECURITY_CLASS']:
+        codes, categories = pd.factorize(master[col].fillna(''), sort=True)
+        compact[col] = pd.Categorical.from_codes(codes[ids], categories=categories)
+    compact = pd.DataFrame(dict(compact, DATE=to_date_key(df['DATE']).to_numpy()))
+    for col in ['OPEN_PRICE', 'HIGH_PRICE', 'LOW_PRICE', 'CLOSE_PRICE']:
+        values = df[col].to_numpy(dtype=np.float64)
+        narrow = values.astype(np.float32)
+        compact[col] = narrow if np.array_equal(widen_prices(narrow), values, equal_nan=True) else values
+    return compact
+
+# Function to cap a screener table at the top `k` rows by GAIN_PERCENT for the bar chart, folding the
+# rest into one "Others (n)" bar with their mean gain. Tables of at most k rows are returned as is.
+def top_k_bars(table, k=BAR_CHART_TOP_K):
+    if len(table) <= k:
+        return table
+    ranked = table.sort_values('GAIN_PERCENT', ascending=False, kind='stable')
+    others = ranked.iloc[k:]
+    bucket = pd.DataFrame({
+        'SECURITY': [f"Others ({len(others)})"],
+        'GAIN_PERCENT': [others['GAIN_PERCENT'].mean()],
+    })
+    return pd.concat([ranked.iloc[:k], bucket], ignore_index=True)
+
+# Function to prepare candlestick data within a point budget: daily candles when the history fits in
+# max_points, otherwise weekly and then monthly OHLC (first open, highest high, lowest low, last
+# close, dated by the first trading day of the period). Returns the candles and their frequency.
+def resample_candles(history, max_points=CANDLESTICK_MAX_POINTS):
+    dates = history['DATE'] if pd.api.types.is_datetime64_any_dtype(history['DATE']) else from_date_key(history['DATE'].to_numpy())
+    candles = pd.DataFrame({
+        'DATE': dates.to_numpy(),
+        'OPEN_PRICE': widen_prices(history['OPEN_PRICE'].to_numpy()),
+        'HIGH_PRICE': widen_prices(history['HIGH_PRICE'].to_numpy()),
+        'LOW_PRICE': widen_prices(history['LOW_PRICE'].to_numpy()),
+        'CLOSE_PRICE': widen_prices(history['CLOSE_PRICE'].to_numpy()),
+    }).sort_values('DATE', kind='stable')
+    if len(candles) <= max_points:
+        return candles.reset_index(drop=True), "daily"
+    for frequency, period in (("weekly", "W-FRI"), ("monthly", "M")):
+        resampled = candles.groupby(candles['DATE'].dt.to_period(period), sort=True).agg(
+            DATE=('DATE', 'first'),
+            OPEN_PRICE=('OPEN_PRICE', 'first'),
+            HIGH_PRICE=('HIGH_PRICE', 'max'),
+            LOW_PRICE=('LOW_PRICE', 'min'),
+            CLOSE_PRICE=('CLOSE_PRICE', 'last'),
+        ).reset_index(drop=True)
+        if len(resampled) <= max_points:
+            break
+    return resampled, frequency
+
+# Function to extend screener rows loaded from the latest partitions back in time until every
+# SECURITY in them has `rows` rows and every instrument key CONTINUOUS_GAIN_DAYS rows, or all of its
+# history (per the FIRST_DATE of the security master). The day-wise anchor and the continuous-gain
+# window count rows, so a security that skipped sessions needs rows from before the window. Older
+# partitions are read in blocks that double in size, only for the securities still short of rows.
+def extend_screener_rows(df, master, paths, read, rows, block):
+    names = pd.factorize(master['SECURITY'])[0]
+    keys = pd.factorize(master['KEY'])[0]
+    # A NaT FIRST_DATE is a security without stored rows (kept for its id); a master without the
+    # column (an older store) gives no bound, so short securities are read back to the first partition
+    if 'FIRST_DATE' in master.columns:
+        first_dates = master['FIRST_DATE'].fillna(pd.Timestamp.max).to_numpy('datetime64[ns]').view(np.int64)
+    else:
+        first_dates = np.full(len(master), np.iinfo(np.int64).min)
+    # Other securities sharing a key (e.g. an old name) are not part of the screen, so not of its rows
+    row_ids = df['SECURITY_ID'].to_numpy()
+    candidates = np.isin(names, names[np.unique(row_ids)]) & (names >= 0) & master['SYMBOL'].notna().to_numpy()
+    groups = []
+    for codes, needed in ((names, rows), (keys, CONTINUOUS_GAIN_DAYS)):
+        first = np.full(codes.max() + 1, np.iinfo(np.int64).max)
+        np.minimum.at(first, codes[candidates], first_dates[candidates])
+        groups.append((codes, needed, first, np.bincount(codes[row_ids], minlength=len(first))))
+    frames = [df]
+    loaded = len(paths) - block
+    while loaded > 0:
+        earliest = pd.Timestamp(os.path.basename(paths[loaded])[:-len(".parquet")]).value
+        short = np.zeros(len(master), dtype=bool)
+        for codes, needed, first, counts in groups:
+            short |= ((counts < needed) & (first < earliest))[codes]
+        short &= candidates
+        if not short.any():
+            break
+        chunk = paths[max(loaded - block, 0):loaded]
+        loaded -= len(chunk)
+        block *= 2
+        older = read(chunk, np.flatnonzero(short))
+        frames.insert(0, older)
+        for codes, _, _, counts in groups:
+            counts += np.bincount(codes[older['SECURITY_ID'].to_numpy()], minlength=len(counts))
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else df
+
+# Function to load the screener frame outside Streamlit: cleaned, compact prices of the securities
+# that traded in the latest `lookback` trading days (all history when None), limited to F&O first
+# words when an F&O list is given (as run_app does). Rows from before the window are added where a
+# day range of up to `lookback` (at most SCREENER_LOOKBACK_DAYS) days needs them (see
+# extend_screener_rows), so the gains match a load of the full history of those securities; only
+# the close filter, which drops rows, may still move an anchor to before the loaded rows. Only the
+# needed date partitions are read, so the load time does not grow with history. With the store, the
+# F&O list is matched once per security of the master and pushed down as SECURITY_IDs.
+# extra_columns are further store columns (e.g. HI_52_WK) carried along as float64 (store only).
+def load_screener_frame(fno_list=None, lookback=SCREENER_LOOKBACK_DAYS, security=None, extra_columns=()):
+    master = load_security_master()
+    prices = ['OPEN_PRICE', 'HIGH_PRICE', 'LOW_PRICE', 'CLOSE_PRICE', 'DATE']
+    paths = list_partitions()
+    if master is not None and paths:
+        # Rows carry SECURITY_ID only: names, first words and keys come from the master, no string work per row
+        allowed = master['SYMBOL'].notna().to_numpy()
+        fno_ids = None
+        if fno_list:
+            allowed = allowed & fno_word_flags(master['FIRST_WORD'], fno_list)
+            fno_ids = np.flatnonzero(allowed)
+
+        def read(chunk, ids=fno_ids):
+            start, end = (os.path.basename(path)[:-len(".parquet")] for path in (chunk[0], chunk[-1]))
+            rows = load_price_store(['SECURITY_ID'] + prices + list(extra_columns), start, end, security=security, ids=ids)
+            rows = rows.dropna(subset=prices)
+            return rows[allowed[rows['SECURITY_ID'].to_numpy()]]
+
+        block = min(lookback or len(paths), len(paths))
+        df = read(paths[-block:])
+        if block < len(paths):
+            df = extend_screener_rows(df, master, paths, read, min(lookback, SCREENER_LOOKBACK_DAYS), block)
+        compact = compact_price_frame(df, master)
+        for col in extra_columns:
+            compact[col] = df[col].to_numpy(dtype=np.float64)
+        return compact
+
+    df = load_price_data(columns=['SYMBOL', 'SECURITY'] + prices, security=security)
+    if df is None:
+        return None
+    df = clean_price_frame(df)
+    if lookback:
+        # The merged CSV is read whole anyway: keep the full history of the securities in the window
+        window = np.sort(df['DATE'].unique())[-lookback:]
+        df = df[df['SECURITY'].isin(df.loc[df['DATE'].isin(window), 'SECURITY'].unique())]
+    return filter_first_word_partial(compact_price_frame(df, master), fno_list).reset_index(drop=True)
+
+# Function to get a token that changes whenever ingestion writes new price data
+def data_version():
+    return file_version(manifest_file_path), file_version(merged_file_path)
+
+# Function to get a file's modification time (None when the file does not exist)
+def file_version(path):
+    return os.stat(path).st_mtime_ns if os.path.exists(path) else None
+
+# Function to read the F&O first words from FO_SECURITY.xlsx (None when the file is missing)
+def read_fno_list():
+    if not os.path.exists(fno_file_path):
+        return None
+    df_fno = pd.read_excel(fno_file_path)
+    df_fno['FIRST_WORD'] = first_word(df_fno['SECURITY'])
+    return df_fno['FIRST_WORD'].tolist()
+
+# Function to read the SYMBOL list from tickers.csv (None when the file is missing)
+def read_ticker_symbols():
+    if not os.path.exists(tickers_file_path):
+        return None
+    df_tickers = pd.read_csv(tickers_file_path)
+    if 'SYMBOL' not in df_tickers.columns:
+        return []
+    return normalize_symbol(df_tickers['SYMBOL']).tolist()
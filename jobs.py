@@ -0,0 +1,226 @@
+# jobs.py
+# Background ingestion jobs for the app and the API. Jobs run one at a time in a worker thread, so
+# a click or a POST returns at once. A request that arrives while an equivalent job is queued or
+# running joins that job instead of starting a competing run. Across processes, runs are serialized
+# by engine.ingest_lock(), and job progress is mirrored to output/ingest_status.json so the app, the
+# API and the CLI can all report it.
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+import engine
+
+JOB_HISTORY = 20  # Finished jobs kept for status queries
+STATUS_STALE_SECONDS = 30  # A "running" status file older than this, with the lock free, is from a dead process
+
+# Readable name of each progress step of engine.process_zip_files()
+STEP_LABELS = {
+    "waiting": "Waiting for another ingestion run",
+    "read": "Reading archives",
+    "write_price_store": "Writing price store",
+    "update_indicators": "Updating indicators",
+    "export_csv": "Exporting merged_output.csv",
+}
+
+class IngestJob:
+    # zip_names: the archives of zip/ to ingest (None for all of them)
+    def __init__(self, job_id, incremental=True, workers=1, write_csv=True, zip_names=None):
+        self.id = job_id
+        self.incremental = incremental
+        self.workers = workers
+        self.write_csv = write_csv
+        self.zip_names = None if zip_names is None else sorted(zip_names)
+        self.state = "queued"  # queued -> waiting (for another process) -> running -> succeeded / failed
+        self.step = None
+        self.done = 0
+        self.total = 0
+        self.archive = None
+        self.message = None
+        self.rows = None  # Rows ingested, None when the job found no new data
+        self.requests = 1  # Submissions served by this job
+        self.submitted_at = datetime.now().isoformat(timespec="seconds")
+        self.started_at = None
+        self.started = None  # time.time() when the job started, to spot archives that arrived later
+        self.finished_at = None
+        self.finished = threading.Event()
+
+    # Function to check whether this job also does what a request asks: a full rebuild covers an
+    # incremental run, a run with the CSV export covers one without, and a run of every archive
+    # covers one of some archives
+    def covers(self, incremental, write_csv, zip_names=None):
+        archives = self.zip_names is None or (zip_names is not None and set(zip_names) <= set(self.zip_names))
+        return (incremental or not self.incremental) and (self.write_csv or not write_csv) and archives
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "state": self.state,
+            "step": self.step,
+            "label": STEP_LABELS.get(self.step),
+            "done": self.done,
+            "total": self.total,
+            "archive": self.archive,
+            "message": self.message,
+            "incremental": self.incremental,
+            "workers": self.workers,
+            "write_csv": self.write_csv,
+            "zip_names": self.zip_names,
+            "rows": self.rows,
+            "requests": self.requests,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+# Function to check whether an archive in zip/ was written after `since` (a time.time() value)
+def archives_changed_since(since):
+    if not os.path.isdir(engine.source_folder):
+        return False
+    with os.scandir(engine.source_folder) as entries:
+        return any(entry.name.endswith(".zip") and entry.stat().st_mtime >= since for entry in entries)
+
+# Function to write the status of a job to output/ingest_status.json atomically
+def write_status(job):
+    status = dict(job.to_dict(), pid=os.getpid(), updated=time.time())
+    os.makedirs(engine.output_folder, exist_ok=True)
+    tmp_path = f"{engine.ingest_status_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(status, f, indent=2)
+    os.replace(tmp_path, engine.ingest_status_path)
+
+# Function to read the latest job status written by any process (None before the first job).
+# A run whose process died is reported as "interrupted".
+def read_status():
+    try:
+        with open(engine.ingest_status_path, "r", encoding="utf-8") as f:
+            status = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if status.get("state") in ("waiting", "running") and time.time() - status.get("updated", 0) > STATUS_STALE_SECONDS:
+        if not engine.ingest_locked():
+            status["state"] = "interrupted"
+    return status
+
+class IngestJobManager:
+    # on_ingest: called (in the worker thread) after a job ingested new data, e.g. to swap in a
+    # fresh dataset before the next request needs it
+    def __init__(self, on_ingest=None):
+        self.on_ingest = on_ingest
+        self.lock = threading.Lock()
+        self.queue = deque()
+        self.current = None
+        self.history = deque(maxlen=JOB_HISTORY)
+        self.ids = itertools.count(1)
+        self.worker = None
+
+    # Function to request an ingestion run. Returns the job that will serve it: a queued job that
+    # covers the request, the running one if it covers the request and no archive arrived after it
+    # started, else a new job at the end of the queue.
+    def submit(self, incremental=True, workers=1, write_csv=True, zip_names=None):
+        with self.lock:
+            for job in self.queue:
+                if job.covers(incremental, write_csv, zip_names):
+                    job.requests += 1
+                    return job
+            current = self.current
+            if current is not None and current.covers(incremental, write_csv, zip_names) and not archives_changed_since(current.started):
+                current.requests += 1
+                return current
+            job = IngestJob(next(self.ids), incremental, workers, write_csv, zip_names)
+            self.queue.append(job)
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run, name="ingest-jobs", daemon=True)
+                self.worker.start()
+            return job
+
+    # Function to run queued jobs until the queue is empty. The job slot and the worker are released
+    # however a job ends, so a later submit() always finds a worker to start.
+    def run(self):
+        try:
+            while True:
+                with self.lock:
+                    if not self.queue:
+                        self.worker = None
+                        return
+                    job = self.queue.popleft()
+                    job.started = time.time()
+                    self.current = job
+                try:
+                    self.execute(job)
+                finally:
+                    with self.lock:
+                        self.current = None
+                        self.history.append(job)
+        finally:
+            with self.lock:
+                if self.worker is threading.current_thread():
+                    self.worker = None
+
+    # Function to run one job, recording its progress on the job and in the status file. Failures of
+    # the ingestion, of the status file or of on_ingest() fail the job instead of the worker.
+    def execute(self, job):
+        job.state = "running"
+        job.started_at = datetime.now().isoformat(timespec="seconds")
+
+        def progress(step, done, total, archive):
+            job.state = "waiting" if step == "waiting" else "running"
+            job.step, job.done, job.total, job.archive = step, done, total, archive
+            write_status(job)
+
+        try:
+            write_status(job)
+            success, message, new_df = engine.process_zip_files(
+                job.incremental, job.workers, job.write_csv, job.zip_names, progress=progress
+            )
+            if new_df is not None:
+                job.rows = len(new_df)
+                if self.on_ingest is not None:
+                    self.on_ingest()
+        except Exception as e:  # Keep the worker alive for the jobs queued behind this one
+            success, message = False, f"❌ {e}"
+        job.state = "succeeded" if success else "failed"
+        job.message = message
+        job.finished_at = datetime.now().isoformat(timespec="seconds")
+        try:
+            write_status(job)
+        except OSError:
+            pass  # The job itself still reports its outcome
+        finally:
+            job.finished.set()
+
+    # Function to find a job of this process by id (None when it is unknown or no longer kept)
+    def get(self, job_id):
+        with self.lock:
+            for job in [self.current, *self.queue, *self.history]:
+                if job is not None and job.id == job_id:
+                    return job
+        return None
+
+    # Function to get the job in progress: this process's running or queued job, else a run of
+    # another process from the status file (None when nothing is ingesting)
+    def active(self):
+        with self.lock:
+            job = self.current or (self.queue[0] if self.queue else None)
+        if job is not None:
+            return job.to_dict()
+        status = read_status()
+        if status is not None and status.get("pid") != os.getpid() and status["state"] in ("waiting", "running"):
+            return status
+        return None
+
+    def status(self):
+        with self.lock:
+            current = self.current.to_dict() if self.current is not None else None
+            queued = [job.to_dict() for job in self.queue]
+            recent = [job.to_dict() for job in reversed(self.history)]
+        return {
+            "current": current,
+            "queued": queued,
+            "recent": recent,
+            "active": self.active(),
+            "latest": read_status(),
+            "locked": engine.ingest_locked(),
+        }
@@ -0,0 +1,147 @@
+# profiling.py
+# Lightweight stage profiling for ingestion, the Streamlit app and the API: wall time, rows in/out
+# and resident memory delta per stage. Set EQUITY_PROFILING=0 to turn it off; stage() then hands
+# back one shared no-op context and nothing is measured or stored.
+import functools
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+PROFILING_ENABLED = os.environ.get("EQUITY_PROFILING", "1") != "0"
+MAX_RUNS = 200  # Finished runs kept for the Performance panel and /api/metrics
+
+recent_runs = deque(maxlen=MAX_RUNS)
+_recent_runs_lock = threading.Lock()
+_current = threading.local()
+
+# Function to turn profiling on or off at runtime
+def set_enabled(enabled):
+    global PROFILING_ENABLED
+    PROFILING_ENABLED = bool(enabled)
+
+# Function to read the resident set size of this process in bytes (None when unavailable).
+# Uses psutil when installed, /proc on Linux otherwise.
+def current_rss():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+# No-op stand-in for Stage/Run when profiling is disabled
+class _NullContext:
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_CONTEXT = _NullContext()
+
+# One measured stage. The record returned by `with` can be given rows_out (or any extra field)
+# inside the block.
+class Stage:
+    def __init__(self, name, rows_in=None):
+        self.record = {"stage": name, "rows_in": rows_in, "rows_out": None}
+
+    def __enter__(self):
+        self.start_rss = current_rss()
+        self.start = time.perf_counter()
+        return self.record
+
+    def __exit__(self, exc_type, *exc):
+        self.record["seconds"] = round(time.perf_counter() - self.start, 6)
+        end_rss = current_rss()
+        if self.start_rss is not None and end_rss is not None:
+            self.record["memory_delta_mb"] = round((end_rss - self.start_rss) / (1024 * 1024), 2)
+        if exc_type is not None:
+            self.record["error"] = exc_type.__name__
+        run = getattr(_current, "run", None)
+        if run is not None:
+            run["stages"].append(self.record)
+        else:
+            _store_run({"run": self.record["stage"], "started": datetime.now().isoformat(timespec="seconds"),
+                        "seconds": self.record["seconds"], "stages": [self.record]})
+        return False
+
+# A group of stages (one ingest, one Streamlit rerun, one API request)
+class Run:
+    def __init__(self, name):
+        self.run = {"run": name, "started": datetime.now().isoformat(timespec="seconds"), "stages": []}
+
+    def __enter__(self):
+        self.parent = getattr(_current, "run", None)
+        _current.run = self.run
+        self.start = time.perf_counter()
+        return self.run
+
+    def __exit__(self, *exc):
+        self.run["seconds"] = round(time.perf_counter() - self.start, 6)
+        _current.run = self.parent
+        if self.parent is not None:
+            self.parent["stages"].extend(self.run["stages"])
+        else:
+            _store_run(self.run)
+        return False
+
+# Function to remember a finished run
+def _store_run(run):
+    with _recent_runs_lock:
+        recent_runs.append(run)
+
+# Function to measure one stage: `with stage("load", rows_in=len(df)) as record: ...`
+def stage(name, rows_in=None):
+    if not PROFILING_ENABLED:
+        return _NULL_CONTEXT
+    return Stage(name, rows_in)
+
+# Function to group the stages measured inside the block into one named run
+def profiled_run(name):
+    if not PROFILING_ENABLED:
+        return _NULL_CONTEXT
+    return Run(name)
+
+# Function to decorate a function so that every call is one profiled run
+def profiled(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with profiled_run(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# Function to get the stages measured so far in the run active on this thread
+def current_stages():
+    run = getattr(_current, "run", None)
+    return list(run["stages"]) if run is not None else []
+
+# Function to get finished runs, newest last, optionally only those with the given name
+def get_runs(name=None, limit=None):
+    with _recent_runs_lock:
+        runs = [run for run in recent_runs if name is None or run["run"] == name]
+    return runs[-limit:] if limit else runs
+
+# Function to aggregate the kept runs per run name and stage: count, mean, max and last seconds
+def summarize_runs():
+    summary = {}
+    for run in get_runs():
+        for record in run["stages"]:
+            entry = summary.setdefault(f"{run['run']}.{record['stage']}", {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            entry["count"] += 1
+            entry["total_seconds"] += record["seconds"]
+            entry["max_seconds"] = max(entry["max_seconds"], record["seconds"])
+            entry["last_seconds"] = record["seconds"]
+    for entry in summary.values():
+        entry["mean_seconds"] = round(entry["total_seconds"] / entry["count"], 6)
+        entry["total_seconds"] = round(entry["total_seconds"], 6)
+    return summary
@@ -0,0 +1,284 @@
+# test_engines.py
+# Regression checks of the vectorized engines against the original per-group loops of run_app, on
+# the sample archives in zip/ (skipped when there are none). Run with: python -m pytest -q
+import io
+import os
+import shutil
+import zipfile
+import numpy as np
+import pandas as pd
+import pytest
+import backtest
+import engine
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_ZIPS = sorted(f for f in os.listdir(os.path.join(REPO_DIR, "zip")) if f.endswith(".zip")) if os.path.isdir(os.path.join(REPO_DIR, "zip")) else []
+
+pytestmark = pytest.mark.skipif(not SAMPLE_ZIPS, reason="no sample archives in zip/")
+
+# Original day-wise gain loop of run_app
+def baseline_daywise_gain(df, days):
+    df_sorted = df.sort_values(['SECURITY', 'DATE'])
+    gain_data = []
+    for sec, group in df_sorted.groupby(['SECURITY']):
+        group = group.reset_index(drop=True)
+        if len(group) >= days:
+            low_price = group.iloc[-days]['LOW_PRICE']
+        else:
+            low_price = group['LOW_PRICE'].iloc[0]
+        close_price = group['CLOSE_PRICE'].iloc[-1]
+        gain_percent = ((close_price - low_price) / low_price) * 100 if low_price != 0 else 0
+        symbol = group['SYMBOL'].iloc[-1]
+        gain_data.append({
+            'SECURITY': sec[0],
+            'SYMBOL': symbol,
+            'LOW_PRICE': low_price,
+            'CLOSE_PRICE': close_price,
+            'GAIN_PERCENT': gain_percent
+        })
+    return pd.DataFrame(gain_data)
+
+# Original continuous-gain loop of core.py
+def baseline_continuous_gain(df, days=5):
+    df_sorted = df.sort_values(['SYMBOL', 'DATE'])
+    continuous_gain_data = {}
+
+    for symbol, group in df_sorted.groupby('SYMBOL'):
+        # Get the last 5 days of data (or less if not available)
+        group = group.tail(days)
+        if len(group) < 2:  # Need at least 2 days to compare
+            continuous_gain_data[symbol] = 0.0
+            continue
+
+        # Check continuous gains and calculate percentage from lowest point
+        closes = group['CLOSE_PRICE'].values
+        lows = group['OPEN_PRICE'].values
+        is_continuous_gain = True
+        start_idx = 0
+
+        # Find the last sequence of continuous gains
+        for i in range(1, len(closes)):
+            if closes[i] <= closes[i-1]:
+                is_continuous_gain = False
+                start_idx = i
+                break
+
+        if is_continuous_gain and len(closes) > 1:
+            # If all days are continuous gains, use the lowest low price
+            lowest_price = min(lows)
+            latest_close = closes[-1]
+            gain_percent = ((latest_close - lowest_price) / lowest_price) * 100 if lowest_price != 0 else 0.0
+            continuous_gain_data[symbol] = round(gain_percent, 2)
+        elif start_idx < len(closes) - 1:
+            # Calculate gain from the low of the first candle in the last continuous sequence
+            lowest_price = min(lows[start_idx:])
+            latest_close = closes[-1]
+            gain_percent = ((latest_close - lowest_price) / lowest_price) * 100 if lowest_price != 0 else 0.0
+            continuous_gain_data[symbol] = round(gain_percent, 2)
+        else:
+            continuous_gain_data[symbol] = 0.0
+
+    return continuous_gain_data
+
+# Original F&O first-word filter of run_app
+def baseline_filter_first_word_partial(df, fno_list):
+    if not fno_list:
+        return df
+    mask = df['FIRST_WORD'].apply(lambda x: any(fno in x for fno in fno_list))
+    return df[mask]
+
+# Ingest the sample archives once into a scratch directory (engine paths are relative to the cwd)
+@pytest.fixture(scope="module")
+def workdir(tmp_path_factory):
+    path = tmp_path_factory.mktemp("store")
+    os.makedirs(path / "zip")
+    for name in SAMPLE_ZIPS:
+        shutil.copy(os.path.join(REPO_DIR, "zip", name), path / "zip" / name)
+    shutil.copytree(os.path.join(REPO_DIR, "data"), path / "data")
+    cwd = os.getcwd()
+    os.chdir(path)
+    success, message, _ = engine.process_zip_files()
+    assert success, message
+    yield path
+    os.chdir(cwd)
+
+# The cleaned frame of the original run_app: archives merged by the original process_zip_files
+# (Pd*.csv columns A, B, C and J to P dropped, DATE added) and round-tripped through the CSV
+@pytest.fixture(scope="module")
+def baseline_frame(workdir):
+    merged_data = []
+    for zip_file in SAMPLE_ZIPS:
+        with zipfile.ZipFile(os.path.join("zip", zip_file)) as zip_ref:
+            for member in zip_ref.namelist():
+                file = os.path.basename(member)
+                if file.startswith("Pd") and file.endswith(".csv"):
+                    df = pd.read_csv(io.BytesIO(zip_ref.read(member)))
+                    df.drop(df.columns[[0, 1] + list(range(9, 16))], axis=1, inplace=True)
+                    df["DATE"] = engine.extract_date(zip_file)
+                    merged_data.append(df)
+    df = pd.read_csv(io.StringIO(pd.concat(merged_data, ignore_index=True).to_csv(index=False)))
+    df = df.dropna(subset=['LOW_PRICE', 'HIGH_PRICE', 'CLOSE_PRICE', 'OPEN_PRICE', 'DATE', 'SYMBOL'])
+    for col in ['CLOSE_PRICE', 'OPEN_PRICE', 'LOW_PRICE', 'HIGH_PRICE']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    df['DATE'] = pd.to_datetime(df['DATE'], format='%d-%b-%Y', errors='coerce')
+    df['FIRST_WORD'] = df['SECURITY'].str.split().str[0].str.upper().str.strip().fillna('')
+    df['SYMBOL'] = df['SYMBOL'].astype(str).str.upper().str.strip()
+    return df
+
+# Original screener of run_app (sidebar security and symbol left at "All"). Two deliberate changes:
+# index rows (blank SYMBOL) get their continuous gain per SECURITY instead of one shared group, and
+# the latest open of a SYMBOL listed twice on a date is the later row (the original sort was unstable).
+def baseline_screener(df, fno_list, days, gain_threshold, close_min, security_type):
+    df = baseline_filter_first_word_partial(df, fno_list)
+    df_sorted_by_date = df.sort_values('DATE', kind='stable')
+    yesterday_open_price = df_sorted_by_date.groupby('SYMBOL')['OPEN_PRICE'].last().reset_index()
+    yesterday_open_price.rename(columns={'OPEN_PRICE': 'YESTERDAY_OPEN_PRICE'}, inplace=True)
+
+    df_filtered = df
+    if security_type == "Nifty":
+        df_filtered = df_filtered[df_filtered['SECURITY'].str.startswith("Nifty", na=False)]
+    elif security_type == "2.5%":
+        df_filtered = df_filtered[df_filtered['SECURITY'].str.startswith("2.5", na=False)]
+    elif security_type == "Others":
+        df_filtered = df_filtered[~df_filtered['SECURITY'].str.startswith(("Nifty", "2.5"), na=False)]
+    if close_min is not None:
+        df_filtered = df_filtered[df_filtered['CLOSE_PRICE'] >= close_min]
+
+    df_daywise = baseline_daywise_gain(df_filtered, days)
+    df_final_filtered = df_daywise[df_daywise['GAIN_PERCENT'] >= gain_threshold]
+    df_final_filtered = df_final_filtered.merge(yesterday_open_price, on='SYMBOL', how='left')
+    keys = engine.instrument_key(df_filtered)
+    continuous_gains = baseline_continuous_gain(df_filtered.assign(SYMBOL=keys))
+    df_final_filtered['CONTINUOUS_GAIN'] = engine.instrument_key(df_final_filtered).map(continuous_gains)
+    df_final_filtered = df_final_filtered.reset_index(drop=True)
+    df_final_filtered.insert(0, 'S.No', range(1, len(df_final_filtered) + 1))
+    return df_final_filtered
+
+@pytest.fixture(scope="module")
+def fno_list(workdir):
+    return engine.read_fno_list()
+
+@pytest.mark.parametrize("days", [1, 2, 3, 5, 30])
+def test_daywise_gain_matches_loop(baseline_frame, days):
+    expected = baseline_daywise_gain(baseline_frame, days)
+    result = engine.calculate_daywise_gain(baseline_frame, days)
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), expected, check_dtype=False)
+
+def test_daywise_gain_several_days_in_one_pass(baseline_frame):
+    results = engine.calculate_daywise_gain(baseline_frame, [1, 5, 30])
+    for days, result in results.items():
+        pd.testing.assert_frame_equal(result, engine.calculate_daywise_gain(baseline_frame, days))
+
+def test_daywise_gain_on_compact_frame(workdir, baseline_frame, fno_list):
+    compact = engine.load_screener_frame(fno_list, lookback=None)
+    expected = baseline_daywise_gain(baseline_filter_first_word_partial(baseline_frame, fno_list), 5)
+    # Section header rows ("OTHER SECURITIES") have blank prices: the store drops them, the loop
+    # reported them with a NaN gain that no threshold lets through
+    expected = expected[expected['GAIN_PERCENT'].notna()].reset_index(drop=True)
+    result = engine.calculate_daywise_gain(compact, 5)
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), expected, check_dtype=False)
+
+def test_continuous_gain_matches_loop(baseline_frame):
+    keys = engine.instrument_key(baseline_frame)
+    expected = pd.Series(baseline_continuous_gain(baseline_frame.assign(SYMBOL=keys)), name='CONTINUOUS_GAIN')
+    result = engine.calculate_continuous_gain(baseline_frame)
+    pd.testing.assert_series_equal(result['CONTINUOUS_GAIN'], expected.rename_axis('KEY'), check_dtype=False)
+
+def test_streak_length_counts_trailing_rising_closes(baseline_frame):
+    result = engine.calculate_continuous_gain(baseline_frame)
+    df = baseline_frame.assign(KEY=engine.instrument_key(baseline_frame)).sort_values(['KEY', 'DATE'])
+    for key, group in df.groupby('KEY'):
+        closes = group['CLOSE_PRICE'].to_numpy()[-5:]
+        streak = 0
+        while streak < len(closes) - 1 and closes[-1 - streak] > closes[-2 - streak]:
+            streak += 1
+        assert result.loc[key, 'STREAK_LENGTH'] == streak, key
+
+@pytest.mark.parametrize("days, gain_threshold, close_min, security_type", [
+    (5, 1, 10, "NONE"),
+    (1, -100, None, "NONE"),
+    (3, 2, 10, "Others"),
+    (30, 0, 100, "Others"),
+])
+def test_screener_matches_run_app(baseline_frame, fno_list, days, gain_threshold, close_min, security_type):
+    columns = ['S.No', 'SECURITY', 'SYMBOL', 'LOW_PRICE', 'CLOSE_PRICE', 'YESTERDAY_OPEN_PRICE', 'GAIN_PERCENT', 'CONTINUOUS_GAIN']
+    expected = baseline_screener(baseline_frame, fno_list, days, gain_threshold, close_min, security_type)
+    df = engine.load_screener_frame(fno_list, lookback=None)
+    mask = engine.screener_mask(df, security_type, close_min=close_min)
+    result = engine.run_screener(df, days, gain_threshold, engine.latest_open_prices(df), mask)
+    pd.testing.assert_frame_equal(result[columns], expected[columns], check_dtype=False)
+
+def test_fno_filter_matches_substring_loop(baseline_frame, fno_list):
+    expected = baseline_filter_first_word_partial(baseline_frame, fno_list)
+    pd.testing.assert_frame_equal(engine.filter_first_word_partial(baseline_frame, fno_list), expected)
+    assert engine.filter_first_word_partial(baseline_frame, []) is baseline_frame
+
+def test_compact_prices_widen_back_to_stored_prices(workdir):
+    columns = ['OPEN_PRICE', 'HIGH_PRICE', 'LOW_PRICE', 'CLOSE_PRICE']
+    stored = engine.load_price_data(['SECURITY_ID'] + columns + ['DATE']).dropna(subset=columns + ['DATE'])
+    compact = engine.compact_price_frame(stored, engine.load_security_master())
+    for col in columns:
+        np.testing.assert_array_equal(engine.widen_prices(compact[col].to_numpy()), stored[col].to_numpy())
+    # India VIX is quoted to 4 decimals
+    assert (stored['CLOSE_PRICE'] * 100 % 1 > 1e-6).any()
+    assert compact['CLOSE_PRICE'].dtype == np.float32
+
+# The lookback window, extended for securities that skipped sessions, screens like the full history
+# of the securities that traded in the window
+@pytest.mark.parametrize("lookback, days", [(10, 10), (3, 3), (1, 1)])
+def test_lookback_window_matches_full_history(workdir, fno_list, lookback, days):
+    full = engine.load_screener_frame(fno_list, lookback=None)
+    window = np.sort(full['DATE'].unique())[-lookback:]
+    full = full[full['SECURITY'].isin(full.loc[full['DATE'].isin(window), 'SECURITY'].unique())].reset_index(drop=True)
+    df = engine.load_screener_frame(fno_list, lookback=lookback)
+    assert len(df) < len(full)
+    expected = engine.run_screener(full, days, -100, engine.latest_open_prices(full))
+    result = engine.run_screener(df, days, -100, engine.latest_open_prices(df))
+    pd.testing.assert_frame_equal(result, expected)
+
+# The indicator table written by the ingest holds the day-wise gain inputs and the continuous gain
+# of the screener frame it was built from
+@pytest.mark.parametrize("days", [1, 5, 30])
+def test_indicator_table_matches_screener_frame(workdir, days):
+    indicators = pd.read_parquet(engine.indicators_file_path)
+    df = engine.load_screener_frame()
+    daywise = engine.calculate_daywise_gain(df, days)
+    assert indicators['SECURITY'].tolist() == daywise['SECURITY'].astype(str).tolist()
+    np.testing.assert_array_equal(indicators[f'ANCHOR_LOW_{days}'], daywise['LOW_PRICE'])
+    np.testing.assert_array_equal(indicators['LAST_CLOSE_PRICE'], daywise['CLOSE_PRICE'])
+    continuous = engine.calculate_continuous_gain(df)
+    np.testing.assert_array_equal(indicators['CONTINUOUS_GAIN'], indicators['KEY'].map(continuous['CONTINUOUS_GAIN']))
+
+# A rebuild writes the master before the partitions: it must keep every id the old partitions use,
+# even when it starts from an archive that lists the securities in another order
+def test_rebuild_keeps_security_ids(workdir):
+    before = engine.load_security_master()[['SECURITY_ID', 'SYMBOL', 'SECURITY']]
+    try:
+        success, message, _ = engine.process_zip_files(incremental=False, zip_names=SAMPLE_ZIPS[-1:])
+        assert success, message
+        after = engine.load_security_master()
+        pd.testing.assert_frame_equal(after.loc[:len(before) - 1, before.columns], before)
+        ids = engine.load_price_data(['SECURITY_ID', 'SYMBOL'])
+        assert ids['SYMBOL'].eq(after['SYMBOL'].to_numpy()[ids['SECURITY_ID'].to_numpy()]).all()
+        # Partitions of the archives left out are deleted once the new ones are written
+        assert len(engine.list_partitions()) == 1
+    finally:
+        engine.process_zip_files(incremental=False)
+
+# On each as-of date, the backtest reports every security that traded that day as the screener
+# would have with the data cut off at that date
+@pytest.mark.parametrize("days, security_type, close_min", [(5, "NONE", None), (3, "Others", 10), (30, "NONE", 100)])
+def test_backtest_matches_screener_on_truncated_frames(workdir, fno_list, days, security_type, close_min):
+    df = engine.load_screener_frame(fno_list, lookback=None)
+    dates = np.sort(df['DATE'].unique())
+    hits = backtest.run_backtest(df, days, None, as_of_days=len(dates), security_type=security_type, close_min=close_min)
+    columns = ['SECURITY', 'SYMBOL', 'LOW_PRICE', 'CLOSE_PRICE', 'GAIN_PERCENT', 'CONTINUOUS_GAIN', 'STREAK_LENGTH']
+    for as_of in dates:
+        truncated = df[df['DATE'] <= as_of].reset_index(drop=True)
+        mask = engine.screener_mask(truncated, security_type, close_min=close_min)
+        expected = engine.run_screener(truncated, days, -np.inf, engine.latest_open_prices(truncated), mask)
+        traded = truncated.loc[(truncated['DATE'] == as_of).to_numpy() & (True if mask is None else mask), 'SECURITY']
+        expected = expected[expected['SECURITY'].isin(traded.astype(str))].reset_index(drop=True)
+        result = hits[hits['DATE'] == engine.from_date_key(np.array([as_of]))[0]].reset_index(drop=True)
+        assert len(result)
+        pd.testing.assert_frame_equal(result[columns], expected[columns], check_dtype=False, obj=f"as of {as_of}")
@@ -0,0 +1,104 @@
+# watcher.py
+# Polls zip/ for new or changed bhavcopy archives and ingests them once they have stopped changing.
+# Runs inside the API (set EQUITY_WATCH_INTERVAL) or on its own: python cli.py watch
+import asyncio
+import os
+import sys
+import time
+import zipfile
+from datetime import datetime
+import engine
+import jobs
+
+class ZipWatcher:
+    # interval: seconds between directory polls. settle: seconds an archive's size and mtime must
+    # stay the same before it is ingested (uploads and sync jobs write archives in pieces).
+    # ingest_jobs: the jobs.IngestJobManager that runs the ingestions (a new one by default), so
+    # they are reported like any other job, in its status and in output/ingest_status.json. Its
+    # on_ingest is called after new data was ingested.
+    def __init__(self, interval=5.0, settle=3.0, workers=1, write_csv=True, ingest_jobs=None):
+        self.interval = interval
+        self.settle = settle
+        self.workers = workers
+        self.write_csv = write_csv
+        self.ingest_jobs = ingest_jobs if ingest_jobs is not None else jobs.IngestJobManager()
+        self.seen = {}  # name -> ((size, mtime_ns), monotonic time it was first seen with that signature)
+        self.failed = {}  # name -> signature that failed to ingest; retried once the file changes
+        self.ingests = 0
+        self.last_message = None
+        self.last_ingest_at = None
+
+    # Function to poll zip/ once and return the archives that are ready: settled, readable as a ZIP,
+    # and new or changed compared with the ingestion manifest
+    def scan(self):
+        if not os.path.isdir(engine.source_folder):
+            return []
+        now = time.monotonic()
+        current = {}
+        for name in os.listdir(engine.source_folder):
+            if not name.endswith(".zip"):
+                continue
+            try:
+                stat = os.stat(os.path.join(engine.source_folder, name))
+            except FileNotFoundError:
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            previous = self.seen.get(name)
+            current[name] = (signature, previous[1] if previous and previous[0] == signature else now)
+        self.seen = current
+
+        manifest = engine.load_manifest()
+        archives = manifest["archives"] if engine.manifest_is_current(manifest, self.write_csv) else {}
+        ready = []
+        for name, (signature, since) in current.items():
+            entry = archives.get(name)
+            if entry is not None and (entry.get("size"), entry.get("mtime_ns")) == signature:
+                continue
+            if now - since < self.settle or self.failed.get(name) == signature:
+                continue
+            if zipfile.is_zipfile(os.path.join(engine.source_folder, name)):
+                ready.append(name)
+        return sorted(ready, key=engine.trade_date_key)
+
+    # Function to ingest the ready archives as a job of ingest_jobs, waiting for it in a worker
+    # thread to keep the event loop free. The job reports its own failures.
+    async def ingest(self, names):
+        job = self.ingest_jobs.submit(True, self.workers, self.write_csv, zip_names=names)
+        await asyncio.to_thread(job.finished.wait)
+        success, message = job.state == "succeeded", job.message
+        if job.rows is not None:
+            self.ingests += 1
+        if not success and len(names) == 1 and names[0] in self.seen:
+            self.failed[names[0]] = self.seen[names[0]][0]
+        self.report(message, success)
+        return success
+
+    # Function to record and print the outcome of an ingestion or a poll
+    def report(self, message, success):
+        self.last_message = message
+        self.last_ingest_at = datetime.now().isoformat(timespec="seconds")
+        print(f"[{self.last_ingest_at}] {message}", file=sys.stdout if success else sys.stderr, flush=True)
+
+    # Function to poll until cancelled. A poll that fails (e.g. zip/ or the manifest cannot be
+    # read) is reported and retried at the next interval.
+    async def run(self):
+        while True:
+            try:
+                ready = self.scan()
+                if ready and not await self.ingest(ready) and len(ready) > 1:
+                    # One bad archive fails the whole batch: retry one by one so the others still land
+                    for name in ready:
+                        await self.ingest([name])
+            except Exception as e:  # Keep polling
+                self.report(f"❌ {e}", False)
+            await asyncio.sleep(self.interval)
+
+    def status(self):
+        return {
+            "interval": self.interval,
+            "settle": self.settle,
+            "ingests": self.ingests,
+            "last_message": self.last_message,
+            "last_ingest_at": self.last_ingest_at,
+            "failed": sorted(self.failed),
+        }